@@ -10,10 +10,16 @@ BASE_DIR = Path(__file__).parent.parent
 DATA_DIR = BASE_DIR / "data"
 UPLOAD_DIR = DATA_DIR / "uploads"
 VECTORSTORE_DIR = DATA_DIR / "vectorstore"
+CHUNK_CACHE_DIR = UPLOAD_DIR / ".chunks"
+PARTIAL_UPLOAD_DIR = UPLOAD_DIR / ".partial"  # Chunked uploads in progress
+EMBEDDING_CACHE_DIR = DATA_DIR / "emb_cache"
+MODEL_CACHE_DIR = DATA_DIR / "models"
 
 # Create directories if they don't exist
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 VECTORSTORE_DIR.mkdir(parents=True, exist_ok=True)
+CHUNK_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+PARTIAL_UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 # Groq API Configuration
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
@@ -35,18 +41,66 @@ GROQ_TEMPERATURE = 0.1  # Low temperature for factual responses
 
 # Embedding Configuration (runs locally - FREE)
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BATCH_SIZE = 64  # Chunks encoded per forward pass
+# "onnx-int8" runs a dynamically INT8-quantized ONNX export on CPU (exported once
+# into MODEL_CACHE_DIR); "bf16" runs PyTorch in bfloat16 on CPUs with AVX512-BF16
+# (no quantization error); "sentence-transformers" uses FP32 PyTorch (GPU/MPS if present)
+EMBEDDING_BACKEND = "onnx-int8"
+EMBEDDING_MAX_SEQ_LENGTH = 256  # Tokens per chunk seen by the ONNX encoder
 
 # RAG Configuration 
 CHUNK_SIZE = 1500        
 CHUNK_OVERLAP = 300      
 TOP_K_RESULTS = 9        
 
+# FAISS index (HNSW graph over normalized embeddings, inner-product metric)
+FAISS_HNSW_M = 32                  # Graph neighbours per node
+FAISS_HNSW_EF_CONSTRUCTION = 200   # Build-time search depth (higher = better graph)
+FAISS_HNSW_EF_SEARCH = max(TOP_K_RESULTS * 4, 64)  # Query-time search depth (recall vs latency)
+FAISS_SCALAR_QUANTIZER = "QT_8bit" # Store HNSW vectors as int8 (4x smaller); None keeps FP32
+FAISS_SQ_MIN_TRAIN = 256           # Vectors needed to train the quantizer (FP32 HNSW until then)
+
+# Memory-map the saved index on load instead of reading it into the heap. This
+# covers IVFPQ inverted lists always, and HNSW/SQ vector storage only on faiss
+# builds with IO_FLAG_MMAP_IFC (the HNSW graph itself is still read into RAM).
+# The index is re-read into RAM the first time new documents are added
+FAISS_MMAP = True
+
+# Uploaded chunks are buffered and embedded/added/saved in one batch once this
+# many are pending (or on the next query/delete, /flush, or shutdown)
+INDEX_FLUSH_THRESHOLD = 500
+
+# Large corpora switch to a product-quantized IVF index (~8x less RAM than FP32)
+FAISS_IVFPQ_THRESHOLD = 50000  # Min chunks before building IVFPQ instead of HNSW
+FAISS_IVF_NLIST = 256          # Coarse clusters
+FAISS_IVF_NPROBE = 8           # Clusters scanned per query
+FAISS_PQ_M = 48                # Sub-quantizers (must divide the embedding dim)
+FAISS_PQ_NBITS = 8             # Bits per sub-quantizer code
+
+# PDF extraction (PyMuPDF page ranges of large PDFs are extracted on a pool of
+# worker processes started once with the server)
+PDF_EXTRACT_MAX_WORKERS = 8   # Upper bound on extraction processes
+PDF_PARALLEL_MIN_PAGES = 16   # Smaller PDFs are extracted sequentially
+
+# Semantic query cache (near-duplicate questions skip retrieval + LLM)
+SEMANTIC_CACHE_THRESHOLD = 0.95     # Min cosine similarity to reuse an answer
+SEMANTIC_CACHE_TTL_SECONDS = 3600   # Cached answers expire after 1 hour
+SEMANTIC_CACHE_MAX_ENTRIES = 1024   # LRU eviction beyond this
+
 # API Configuration
 API_HOST = "0.0.0.0"
 API_PORT = 8000
+# Each worker holds its own in-memory index, so uploads in one worker are
+# invisible to the others; keep 1 unless the index moves out of process
+API_WORKERS = 1
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # Stream uploads to disk 1 MB at a time
+
+# Logging (DEBUG adds per-query traces: detected filenames, reformulations, cache hits)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
 # Rate Limiting (Groq free tier)
 GROQ_RATE_LIMIT = {
     "requests_per_minute": 30,
     "tokens_per_minute": 6000
-}
\ No newline at end of file
+}
+GROQ_MAX_ATTEMPTS = 3  # LLM call attempts on 429/connection/5xx (jittered exponential backoff)
\ No newline at end of file
@@ -1,46 +1,261 @@
+import logging
 import os
+import re
 import shutil
+import aiofiles
+import hashlib
+import pickle
+import threading
+import multiprocessing
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Any, Tuple, Optional, AsyncIterator
 from datetime import datetime
+from uuid import uuid4
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pypdf import PdfReader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 import config
 
+logger = logging.getLogger("DocumentManager")
+
+_UPLOAD_ID_RE = re.compile(r"[0-9a-f]{32}")  # uuid4().hex ids of chunked uploads
+
+# PyMuPDF is much faster than pypdf; pypdf stays as the fallback
+try:
+    import fitz
+except ImportError:
+    fitz = None
+
+# Native (Rust) splitter; LangChain's recursive splitter stays as the fallback
+try:
+    from semantic_text_splitter import TextSplitter as NativeTextSplitter
+except ImportError:
+    NativeTextSplitter = None
+
+def _extract_pdf_pages(filepath: str, start: int, stop: int) -> List[str]:
+    """
+    Extract pages [start, stop) with a private PyMuPDF handle
+    Module-level so worker processes can run it (MuPDF isn't safe to use from threads)
+    """
+    with fitz.open(filepath) as doc:
+        return [doc[i].get_text("text") for i in range(start, stop)]
+
+class CompiledSeparatorSplitter(RecursiveCharacterTextSplitter):
+    """
+    RecursiveCharacterTextSplitter that compiles each separator's regex once
+    (LangChain rebuilds the pattern strings on every recursion level of every call)
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._search_patterns: Dict[str, re.Pattern] = {}
+        self._split_patterns: Dict[str, re.Pattern] = {}
+    
+    def _search_pattern(self, separator: str) -> re.Pattern:
+        pattern = self._search_patterns.get(separator)
+        if pattern is None:
+            regex = separator if self._is_separator_regex else re.escape(separator)
+            pattern = self._search_patterns[separator] = re.compile(regex)
+        return pattern
+    
+    def _split_pattern(self, separator: str) -> re.Pattern:
+        pattern = self._split_patterns.get(separator)
+        if pattern is None:
+            regex = separator if self._is_separator_regex else re.escape(separator)
+            # Capture group keeps the separators in re.split's output
+            pattern = self._split_patterns[separator] = re.compile(f"({regex})" if self._keep_separator else regex)
+        return pattern
+    
+    def _split_with_separator(self, text: str, separator: str) -> List[str]:
+        """Same output as LangChain's _split_text_with_regex, with a precompiled pattern"""
+        if not separator:
+            return [c for c in text if c]
+        parts = self._split_pattern(separator).split(text)
+        if self._keep_separator:
+            if self._keep_separator == "end":
+                splits = [parts[i] + parts[i + 1] for i in range(0, len(parts) - 1, 2)]
+                if len(parts) % 2 == 1:
+                    splits.append(parts[-1])
+            else:
+                splits = [parts[i] + parts[i + 1] for i in range(1, len(parts), 2)]
+                splits = [parts[0], *splits]
+        else:
+            splits = parts
+        return [split for split in splits if split]
+    
+    def _split_text(self, text: str, separators: List[str]) -> List[str]:
+        final_chunks = []
+        separator = separators[-1]
+        new_separators = []
+        for i, candidate in enumerate(separators):
+            if not candidate:
+                separator = candidate
+                break
+            if self._search_pattern(candidate).search(text):
+                separator = candidate
+                new_separators = separators[i + 1:]
+                break
+        
+        splits = self._split_with_separator(text, separator)
+        merge_separator = "" if self._keep_separator else separator
+        good_splits = []
+        for split in splits:
+            if self._length_function(split) < self._chunk_size:
+                good_splits.append(split)
+                continue
+            if good_splits:
+                final_chunks.extend(self._merge_splits(good_splits, merge_separator))
+                good_splits = []
+            if new_separators:
+                final_chunks.extend(self._split_text(split, new_separators))
+            else:
+                final_chunks.append(split)
+        if good_splits:
+            final_chunks.extend(self._merge_splits(good_splits, merge_separator))
+        return final_chunks
+
 class DocumentManager:
     def __init__(self):
         self.upload_dir = config.UPLOAD_DIR
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=config.CHUNK_SIZE,
-            chunk_overlap=config.CHUNK_OVERLAP,
-            length_function=len,
-        )
-    
-    def save_uploaded_file(self, file_content: bytes, filename: str) -> str:
-        """Save uploaded file and return filepath"""
+        if NativeTextSplitter is not None:
+            self.text_splitter = NativeTextSplitter(config.CHUNK_SIZE, overlap=config.CHUNK_OVERLAP)
+            self.splitter_name = "native"
+        else:
+            self.text_splitter = CompiledSeparatorSplitter(
+                chunk_size=config.CHUNK_SIZE,
+                chunk_overlap=config.CHUNK_OVERLAP,
+                length_function=len,
+            )
+            self.splitter_name = "recursive"
+        
+        # Memoized (dir mtime, list_documents() result, ETag), keyed on the upload dir's mtime
+        self._listing_cache: Optional[Tuple[int, List[Dict[str, str]], str]] = None
+        
+        # Long-lived PDF extraction workers (see start_pdf_workers); None = sequential
+        self._pdf_pool: Optional[ProcessPoolExecutor] = None
+        self._pdf_workers = 0
+        self._pdf_pool_lock = threading.Lock()
+    
+    def start_pdf_workers(self):
+        """
+        Start the process pool large PDFs are extracted on, once per server process
+        Workers come from forkserver/spawn rather than fork: forking the threaded
+        server would copy its locks mid-use into the child
+        """
+        workers = min(config.PDF_EXTRACT_MAX_WORKERS, os.cpu_count() or 1)
+        if workers <= 1:
+            return
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        with self._pdf_pool_lock:
+            if self._pdf_pool is None:
+                self._pdf_pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+                self._pdf_workers = workers
+    
+    def shutdown(self):
+        """Stop the PDF extraction workers"""
+        with self._pdf_pool_lock:
+            pool, self._pdf_pool = self._pdf_pool, None
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    
+    async def save_uploaded_file(self, upload: Any, filename: str) -> Tuple[str, int, str]:
+        """
+        Stream an async file-like upload (e.g. FastAPI's UploadFile) to disk in chunks
+        without blocking the event loop; returns (filepath, size in bytes, content hash)
+        """
+        filepath = self.upload_dir / filename
+        # Written aside and renamed into place: a re-upload of an existing name
+        # then still changes the upload dir's mtime (which every worker's
+        # listing cache keys on), and readers never see a half-written file
+        temp_path = config.PARTIAL_UPLOAD_DIR / uuid4().hex
+        size = 0
+        hasher = hashlib.blake2b(digest_size=16)
+        try:
+            async with aiofiles.open(temp_path, "wb") as f:
+                while chunk := await upload.read(config.UPLOAD_CHUNK_SIZE):
+                    await f.write(chunk)
+                    hasher.update(chunk)
+                    size += len(chunk)
+            os.replace(temp_path, filepath)
+        finally:
+            temp_path.unlink(missing_ok=True)
+        self._listing_cache = None
+        return str(filepath), size, hasher.hexdigest()
+    
+    @staticmethod
+    def _partial_path(file_id: str) -> Path:
+        """On-disk buffer of a chunked upload (ids are client-generated, so validate)"""
+        if not _UPLOAD_ID_RE.fullmatch(file_id):
+            raise ValueError("Invalid upload id")
+        return config.PARTIAL_UPLOAD_DIR / file_id
+    
+    async def append_upload_chunk(self, file_id: str, offset: int, chunks: AsyncIterator[bytes]) -> int:
+        """
+        Write one piece of a chunked upload at `offset`; returns the bytes received so far
+        Re-sending a piece (client retry) overwrites it, so retries are safe
+        """
+        partial_path = self._partial_path(file_id)
+        received = partial_path.stat().st_size if partial_path.exists() else 0
+        if offset > received:
+            raise ValueError(f"Chunk at offset {offset} but only {received} bytes received")
+        
+        async with aiofiles.open(partial_path, "r+b" if partial_path.exists() else "wb") as f:
+            await f.truncate(offset)
+            await f.seek(offset)
+            async for chunk in chunks:
+                await f.write(chunk)
+            return await f.tell()
+    
+    def commit_chunked_upload(self, file_id: str, filename: str, total: int) -> Tuple[str, int, str]:
+        """
+        Move a fully received chunked upload into place
+        Returns (filepath, size in bytes, content hash) like save_uploaded_file
+        """
+        partial_path = self._partial_path(file_id)
+        size = partial_path.stat().st_size if partial_path.exists() else 0
+        if size != total:
+            raise ValueError(f"Upload incomplete: received {size} of {total} bytes")
+        
+        hasher = hashlib.blake2b(digest_size=16)
+        with open(partial_path, "rb") as f:
+            while chunk := f.read(config.UPLOAD_CHUNK_SIZE):
+                hasher.update(chunk)
+        
         filepath = self.upload_dir / filename
-        with open(filepath, "wb") as f:
-            f.write(file_content)
-        return str(filepath)
+        os.replace(partial_path, filepath)
+        self._listing_cache = None
+        return str(filepath), size, hasher.hexdigest()
     
-    def load_document(self, filepath: str) -> List[Document]:
+    def load_document(self, filepath: str, file_hash: Optional[str] = None) -> List[Document]:
         """Load and chunk document with enhanced metadata"""
         file_path = Path(filepath)
         file_ext = file_path.suffix.lower()
         filename = file_path.name
         
-        # Extract text based on file type
-        if file_ext == ".pdf":
-            text = self._extract_pdf_text(filepath)
-        elif file_ext == ".txt":
-            with open(filepath, "r", encoding="utf-8") as f:
-                text = f.read()
-        else:
+        if file_ext not in (".pdf", ".txt"):
             raise ValueError(f"Unsupported file type: {file_ext}")
         
-        # Split into chunks
-        chunks = self.text_splitter.split_text(text)
+        # Identical content was chunked before -> skip extraction and splitting
+        cache_path = self._chunk_cache_path(file_hash) if file_hash else None
+        chunks = self._load_cached_chunks(cache_path) if cache_path else None
+        
+        if chunks is None:
+            # Extract text based on file type
+            if file_ext == ".pdf":
+                text = self._extract_pdf_text(filepath)
+            else:
+                with open(filepath, "r", encoding="utf-8") as f:
+                    text = f.read()
+            
+            # Split into chunks
+            chunks = self._split_text(text)
+            if cache_path:
+                with open(cache_path, "wb") as f:
+                    pickle.dump(chunks, f)
+        else:
+            logger.info(f"Reusing cached chunks for {filename}")
         
         # Create Document objects with ENHANCED metadata
         documents = [
@@ -59,49 +274,127 @@ class DocumentManager:
             for i, chunk in enumerate(chunks)
         ]
         
-        print(f"[DocumentManager] Created {len(documents)} chunks from {filename}")
+        logger.info(f"Created {len(documents)} chunks from {filename}")
         return documents
     
+    def _split_text(self, text: str) -> List[str]:
+        """Split text into chunks with whichever splitter is available"""
+        if self.splitter_name == "native":
+            return self.text_splitter.chunks(text)
+        return self.text_splitter.split_text(text)
+    
+    def _chunk_cache_path(self, file_hash: str) -> Path:
+        """Chunk cache location, keyed by content hash and splitter settings"""
+        return config.CHUNK_CACHE_DIR / f"{file_hash}_{self.splitter_name}_{config.CHUNK_SIZE}_{config.CHUNK_OVERLAP}.pkl"
+    
+    def _load_cached_chunks(self, cache_path: Path) -> Optional[List[str]]:
+        """Return cached chunk texts, or None on a miss or unreadable entry"""
+        if not cache_path.exists():
+            return None
+        try:
+            with open(cache_path, "rb") as f:
+                return pickle.load(f)
+        except (pickle.UnpicklingError, EOFError, OSError):
+            return None
+    
     def _extract_pdf_text(self, filepath: str) -> str:
-        """Extract text from PDF"""
+        """Extract text from PDF (PyMuPDF, falling back to pypdf on failure)"""
+        if fitz is not None:
+            try:
+                with fitz.open(filepath) as doc:
+                    page_count = doc.page_count
+                
+                pool = self._pdf_pool
+                if pool is None or page_count < config.PDF_PARALLEL_MIN_PAGES:
+                    parts = _extract_pdf_pages(filepath, 0, page_count)
+                else:
+                    # One contiguous page range per worker process
+                    step = -(-page_count // self._pdf_workers)
+                    ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+                    results = pool.map(
+                        _extract_pdf_pages,
+                        [filepath] * len(ranges),
+                        [start for start, _ in ranges],
+                        [stop for _, stop in ranges],
+                    )
+                    parts = [page_text for part in results for page_text in part]
+                return "\n".join(parts)
+            except BrokenProcessPool as e:
+                # A MuPDF crash killed a worker: replace the pool, use pypdf for this file
+                logger.warning(f"PDF worker crashed on {filepath}, falling back to pypdf: {e}")
+                with self._pdf_pool_lock:
+                    if self._pdf_pool is pool:
+                        self._pdf_pool = None
+                pool.shutdown(wait=False)
+                self.start_pdf_workers()
+            except Exception as e:
+                logger.warning(f"PyMuPDF failed on {filepath}, falling back to pypdf: {e}")
+        
+        # Collect pages and join once (repeated += copies the growing string)
         reader = PdfReader(filepath)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        parts = [page.extract_text() or "" for page in reader.pages]
+        return "\n".join(parts)
     
-    def list_documents(self) -> List[Dict[str, str]]:
-        """List all uploaded documents"""
+    def listing_with_etag(self) -> Tuple[List[Dict[str, str]], str]:
+        """
+        The document list plus an HTTP ETag for it
+        The ETag hashes each file's name, exact size and mtime, so it changes
+        with any upload, overwrite or delete (not just with the dir listing)
+        """
+        dir_mtime = os.stat(self.upload_dir).st_mtime_ns
+        cached = self._listing_cache
+        if cached is not None and cached[0] == dir_mtime:
+            return cached[1], cached[2]
+        
         docs = []
-        for file in self.upload_dir.iterdir():
-            if file.is_file() and file.suffix in [".pdf", ".txt"]:
-                stats = file.stat()
-                docs.append({
-                    "filename": file.name,
-                    "size": f"{stats.st_size / 1024:.2f} KB",
-                    "uploaded": datetime.fromtimestamp(stats.st_ctime).strftime("%Y-%m-%d %H:%M"),
-                })
-        return docs
+        hasher = hashlib.blake2b(digest_size=16)
+        # scandir's DirEntry caches file type and stat info from the directory read
+        with os.scandir(self.upload_dir) as entries:
+            for entry in sorted(entries, key=lambda e: e.name):
+                if entry.is_file() and entry.name.endswith((".pdf", ".txt")):
+                    stats = entry.stat()
+                    hasher.update(f"{entry.name}|{stats.st_size}|{stats.st_mtime_ns}\n".encode("utf-8"))
+                    docs.append({
+                        "filename": entry.name,
+                        "size": f"{stats.st_size / 1024:.2f} KB",
+                        "uploaded": datetime.fromtimestamp(stats.st_ctime).strftime("%Y-%m-%d %H:%M"),
+                    })
+        
+        etag = f'"{hasher.hexdigest()}"'
+        self._listing_cache = (dir_mtime, docs, etag)
+        return docs, etag
+    
+    def list_documents(self) -> List[Dict[str, str]]:
+        """List all uploaded documents (cached until the upload dir changes)"""
+        return self.listing_with_etag()[0]
     
     def delete_document(self, filename: str) -> bool:
         """Delete a document file (vector store cleanup handled separately)"""
         filepath = self.upload_dir / filename
         if filepath.exists():
             filepath.unlink()
-            print(f"[DocumentManager] Deleted file: {filename}")
+            self._listing_cache = None
+            logger.info(f"Deleted file: {filename}")
             return True
         return False
     
+    def delete_documents(self, filenames: List[str]) -> List[str]:
+        """Delete several document files, returning the ones that existed"""
+        return [filename for filename in filenames if self.delete_document(filename)]
+    
     def clear_all_documents(self):
         """Delete all documents and vector store"""
-        # Clear uploads
+        # Clear uploads and cached chunks
         for file in self.upload_dir.iterdir():
             if file.is_file():
                 file.unlink()
+        shutil.rmtree(config.CHUNK_CACHE_DIR, ignore_errors=True)
+        config.CHUNK_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        self._listing_cache = None
         
         # Clear vector store
         if config.VECTORSTORE_DIR.exists():
             shutil.rmtree(config.VECTORSTORE_DIR)
             config.VECTORSTORE_DIR.mkdir(parents=True, exist_ok=True)
         
-        print("[DocumentManager] Cleared all documents and vector store")
\ No newline at end of file
+        logger.info("Cleared all documents and vector store")
\ No newline at end of file
@@ -0,0 +1,213 @@
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List
+import numpy as np
+import torch
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface import HuggingFaceEmbeddings
+from transformers import AutoConfig, AutoModel, AutoTokenizer
+import config
+
+logger = logging.getLogger("Embeddings")
+
+# ONNX Runtime + optimum are optional; without them we use sentence-transformers
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+
+def detect_device() -> str:
+    """Pick the fastest available torch device for embeddings"""
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+class SentenceTransformerEmbeddings(HuggingFaceEmbeddings):
+    """HuggingFaceEmbeddings that can also encode straight to a numpy array"""
+
+    @property
+    def fingerprint(self) -> str:
+        """Identifies the model + backend that produced a vector (for caching)"""
+        return f"{self.model_name}|sentence-transformers"
+
+    @property
+    def dimension(self) -> int:
+        return self._client.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Encode texts to one contiguous, L2-normalized float32 array"""
+        # Calls SentenceTransformer directly to skip LangChain's list-of-lists conversion
+        return self._client.encode(
+            texts,
+            batch_size=config.EMBEDDING_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        ).astype(np.float32, copy=False)
+
+
+class PooledEmbeddings(Embeddings):
+    """
+    Mean-pooled transformer embeddings; subclasses supply the forward pass
+    (`_forward`: padded numpy token batch -> last hidden state)
+    """
+    tokenizer = None
+    dimension = 0
+
+    def _forward(self, tokens: Dict[str, np.ndarray]) -> np.ndarray:
+        raise NotImplementedError
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Encode texts to one contiguous, L2-normalized float32 array
+        All texts are tokenized in one call, then run in length-sorted batches
+        padded only to each batch's own longest text (far less wasted compute
+        on chunks of mixed length)
+        """
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+        if not texts:
+            return vectors
+
+        encoded = self.tokenizer(
+            texts,
+            truncation=True,
+            max_length=config.EMBEDDING_MAX_SEQ_LENGTH,
+            return_length=True,
+        )
+        order = np.argsort(encoded["length"], kind="stable")
+        features = [key for key in encoded.keys() if key != "length"]
+
+        for start in range(0, len(texts), config.EMBEDDING_BATCH_SIZE):
+            batch_idx = order[start:start + config.EMBEDDING_BATCH_SIZE]
+            tokens = self.tokenizer.pad(
+                {key: [encoded[key][i] for i in batch_idx] for key in features},
+                padding=True,
+                return_tensors="np",
+            )
+            hidden = self._forward(tokens)
+
+            # Mean-pool over real (non-padding) tokens, scattered back to input order
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            vectors[batch_idx] = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+
+class ONNXInt8Embeddings(PooledEmbeddings):
+    """
+    Sentence-transformer exported to ONNX with dynamic INT8 quantization
+    The encoder's matmuls run as int8 GEMM (AVX512-VNNI where available) on CPU;
+    the quantized model is exported once and reused from disk afterwards
+    """
+    def __init__(self, model_name: str, cache_dir: Path):
+        self.model_name = model_name
+        model_dir = cache_dir / model_name.replace("/", "__")
+        model_path = model_dir / "model_quantized.onnx"
+        if not model_path.exists():
+            self._export(model_name, model_dir)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.dimension = AutoConfig.from_pretrained(model_dir).hidden_size
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = os.cpu_count() or 1
+        self.session = ort.InferenceSession(
+            str(model_path), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    @staticmethod
+    def _export(model_name: str, model_dir: Path):
+        """One-time (slow) ONNX export + dynamic INT8 quantization"""
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+        logger.info(f"Exporting {model_name} to quantized ONNX (one-time)")
+        model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+        model.save_pretrained(model_dir)
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(model_dir)
+
+        quantizer = ORTQuantizer.from_pretrained(model)
+        quantizer.quantize(
+            save_dir=model_dir,
+            quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=True),
+        )
+
+    @property
+    def fingerprint(self) -> str:
+        """Identifies the model + backend that produced a vector (for caching)"""
+        return f"{self.model_name}|onnx-int8"
+
+    def _forward(self, tokens: Dict[str, np.ndarray]) -> np.ndarray:
+        feed = {name: tokens[name].astype(np.int64) for name in self.input_names}
+        return self.session.run(None, feed)[0]
+
+
+class BF16Embeddings(PooledEmbeddings):
+    """
+    Sentence-transformer run in bfloat16 on CPU (AVX512-BF16 / AMX matmuls)
+    Same exponent range as FP32 at half the bytes, so recall is unaffected
+    """
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name, torch_dtype=torch.bfloat16).eval()
+        self.dimension = self.model.config.hidden_size
+        torch.set_num_threads(os.cpu_count() or 1)
+
+    @staticmethod
+    def is_supported() -> bool:
+        """True if this CPU has native bf16 matmuls (otherwise bf16 is emulated and slower)"""
+        bf16_check = getattr(torch.cpu, "_is_avx512_bf16_supported", None)
+        return torch.backends.mkldnn.is_available() and bf16_check is not None and bf16_check()
+
+    @property
+    def fingerprint(self) -> str:
+        """Identifies the model + backend that produced a vector (for caching)"""
+        return f"{self.model_name}|bf16"
+
+    def _forward(self, tokens: Dict[str, np.ndarray]) -> np.ndarray:
+        inputs = {name: torch.from_numpy(array.astype(np.int64)) for name, array in tokens.items()}
+        with torch.inference_mode(), torch.autocast("cpu", dtype=torch.bfloat16):
+            hidden = self.model(**inputs).last_hidden_state
+        return hidden.float().numpy()
+
+
+def create_embeddings() -> Embeddings:
+    """Build the configured embedding backend (falls back to sentence-transformers)"""
+    if config.EMBEDDING_BACKEND == "onnx-int8" and ort is not None:
+        try:
+            embeddings = ONNXInt8Embeddings(config.EMBEDDING_MODEL, config.MODEL_CACHE_DIR)
+            logger.info("Using INT8 ONNX Runtime backend")
+            return embeddings
+        except Exception as e:
+            logger.warning(f"ONNX backend unavailable, falling back to sentence-transformers: {e}")
+
+    if config.EMBEDDING_BACKEND == "bf16":
+        if BF16Embeddings.is_supported():
+            logger.info("Using bfloat16 CPU backend")
+            return BF16Embeddings(config.EMBEDDING_MODEL)
+        logger.warning("CPU lacks native bf16, falling back to sentence-transformers (FP32)")
+
+    device = detect_device()
+    logger.info(f"Using sentence-transformers on {device}")
+    return SentenceTransformerEmbeddings(
+        model_name=config.EMBEDDING_MODEL,
+        model_kwargs={'device': device},
+        encode_kwargs={
+            'batch_size': config.EMBEDDING_BATCH_SIZE,
+            'normalize_embeddings': True,
+        }
+    )
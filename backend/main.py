@@ -1,14 +1,79 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
+from pathlib import Path
+from logging.handlers import QueueHandler, QueueListener
+import asyncio
+import logging
+import queue
 import uvicorn
 
 from document_manager import DocumentManager
 from rag_engine import RAGEngine
 import config
 
-app = FastAPI(title="RAG Document Q&A API")
+def setup_logging() -> QueueListener:
+    """
+    Route all log records through a queue; a background listener thread does
+    the formatting and stdout writes, so request threads never block on I/O
+    """
+    log_queue = queue.Queue(-1)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("[%(name)s] %(message)s"))
+    listener = QueueListener(log_queue, stream_handler)
+    
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(log_queue)]
+    root.setLevel(config.LOG_LEVEL)
+    listener.start()
+    return listener
+
+upload_logger = logging.getLogger("UPLOAD")
+delete_logger = logging.getLogger("DELETE")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the shared managers once per worker, flush queued chunks on shutdown"""
+    # Set up here, not at import: `python main.py` imports this module twice
+    # (as __main__, then as main for uvicorn), which would start two listeners
+    log_listener = setup_logging()
+    app.state.doc_manager = DocumentManager()
+    app.state.doc_manager.start_pdf_workers()
+    app.state.rag_engine = await asyncio.to_thread(RAGEngine)
+    # Load models/index in the background; /health is served meanwhile
+    startup = asyncio.create_task(prepare_engine(app))
+    yield
+    await startup
+    # Index any queued chunks and finish writing them before the process exits
+    await asyncio.to_thread(app.state.rag_engine.flush)
+    await asyncio.to_thread(app.state.rag_engine.wait_for_save)
+    app.state.doc_manager.shutdown()
+    log_listener.stop()
+
+async def prepare_engine(app: FastAPI):
+    """Warm up the engine, then queue any uploaded file the index doesn't know about"""
+    doc_manager = app.state.doc_manager
+    rag_engine = app.state.rag_engine
+    await asyncio.to_thread(rag_engine.warmup)
+    
+    # Chunks are only queued at upload time; a crash before the flush leaves the
+    # file on disk but unindexed, so reconcile the two on every start
+    try:
+        known = await asyncio.to_thread(rag_engine.known_filenames)
+        missing = [doc["filename"] for doc in doc_manager.list_documents() if doc["filename"] not in known]
+        for filename in missing:
+            upload_logger.info(f"Re-queuing unindexed upload: {filename}")
+            documents = await asyncio.to_thread(doc_manager.load_document, str(doc_manager.upload_dir / filename))
+            await asyncio.to_thread(rag_engine.index_documents, documents)
+        if missing:
+            await asyncio.to_thread(rag_engine.flush)
+    except Exception as e:
+        upload_logger.exception(f"Startup reconciliation failed: {e}")
+
+app = FastAPI(title="RAG Document Q&A API", lifespan=lifespan)
 
 # CORS middleware for Streamlit
 app.add_middleware(
@@ -19,13 +84,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize managers
-doc_manager = DocumentManager()
-rag_engine = RAGEngine()
-
 class QueryRequest(BaseModel):
     question: str
 
+class DeleteRequest(BaseModel):
+    filenames: List[str]
+
 class QueryResponse(BaseModel):
     answer: str
     sources: List[Dict[str, Any]]
@@ -37,54 +101,98 @@ def root():
     return {"message": "RAG Document Q&A API is running", "llm_provider": "Groq"}
 
 @app.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
+async def upload_document(request: Request, file: UploadFile = File(...)):
     """Upload and index a document"""
+    doc_manager = request.app.state.doc_manager
     try:
         # Validate file type
         if not file.filename.endswith(('.pdf', '.txt')):
             raise HTTPException(status_code=400, detail="Only PDF and TXT files are supported")
         
-        print(f"[UPLOAD] Starting upload: {file.filename}")
-        
-        # Save file
-        content = await file.read()
-        file_size_mb = len(content) / (1024 * 1024)
-        print(f"[UPLOAD] File size: {file_size_mb:.2f} MB")
+        upload_logger.info(f"Starting upload: {file.filename}")
         
-        filepath = doc_manager.save_uploaded_file(content, file.filename)
-        print(f"[UPLOAD] File saved to: {filepath}")
-        
-        # Load and chunk document
-        print(f"[UPLOAD] Starting document chunking...")
-        documents = doc_manager.load_document(filepath)
-        print(f"[UPLOAD] Created {len(documents)} chunks")
-        
-        # Index documents
-        print(f"[UPLOAD] Starting indexing...")
-        rag_engine.index_documents(documents)
-        print(f"[UPLOAD] Indexing complete")
-        
-        return {
-            "message": f"Successfully uploaded and indexed {file.filename}",
-            "chunks": len(documents),
-            "file_size_mb": round(file_size_mb, 2)
-        }
+        # Stream file to disk (never holds the whole upload in memory)
+        filepath, file_size, file_hash = await doc_manager.save_uploaded_file(file, file.filename)
+        return await index_saved_file(request, file.filename, filepath, file_size, file_hash)
     except Exception as e:
-        print(f"[UPLOAD] Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        upload_logger.exception(f"Error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def index_saved_file(request: Request, filename: str, filepath: str, file_size: int, file_hash: str) -> Dict[str, Any]:
+    """Chunk an uploaded file that is already on disk and queue it for indexing"""
+    doc_manager = request.app.state.doc_manager
+    rag_engine = request.app.state.rag_engine
+    file_size_mb = file_size / (1024 * 1024)
+    upload_logger.info(f"File saved to: {filepath}")
+    upload_logger.info(f"File size: {file_size_mb:.2f} MB")
+    
+    # Load and chunk document (CPU-bound, keep it off the event loop)
+    upload_logger.info(f"Starting document chunking...")
+    documents = await asyncio.to_thread(doc_manager.load_document, filepath, file_hash)
+    upload_logger.info(f"Created {len(documents)} chunks")
+    
+    # Queue for indexing (embedded in a batch at INDEX_FLUSH_THRESHOLD or the next flush/query)
+    await asyncio.to_thread(rag_engine.index_documents, documents)
+    upload_logger.info(f"Chunks queued for indexing")
+    
+    return {
+        "message": f"Uploaded {filename}; its chunks are queued for indexing",
+        "chunks": len(documents),
+        "file_size_mb": round(file_size_mb, 2)
+    }
+
+@app.post("/upload_chunk")
+async def upload_chunk(file_id: str, offset: int, total: int, request: Request):
+    """
+    Receive one piece of a large upload (raw request body, sent in order)
+    Lets big files through proxies that cap request size; finish with /upload_commit
+    """
+    try:
+        received = await request.app.state.doc_manager.append_upload_chunk(
+            file_id, offset, request.stream()
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if received > total:
+        raise HTTPException(status_code=400, detail=f"Received {received} bytes, more than the declared {total}")
+    return {"file_id": file_id, "received": received}
+
+@app.post("/upload_commit")
+async def upload_commit(file_id: str, name: str, total: int, request: Request):
+    """Assemble a chunked upload and index it like /upload"""
+    if not name.endswith(('.pdf', '.txt')):
+        raise HTTPException(status_code=400, detail="Only PDF and TXT files are supported")
+    name = Path(name).name  # Never write outside the upload dir
+    
+    try:
+        filepath, file_size, file_hash = await asyncio.to_thread(
+            request.app.state.doc_manager.commit_chunked_upload, file_id, name, total
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        upload_logger.info(f"Assembled chunked upload: {name}")
+        return await index_saved_file(request, name, filepath, file_size, file_hash)
+    except Exception as e:
+        upload_logger.exception(f"Error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/documents")
-def list_documents():
-    """List all uploaded documents"""
-    return {"documents": doc_manager.list_documents()}
+def list_documents(request: Request):
+    """List all uploaded documents (304 if the client's ETag is still current)"""
+    documents, etag = request.app.state.doc_manager.listing_with_etag()
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse({"documents": documents}, headers={"ETag": etag})
 
 @app.delete("/documents/{filename}")
-def delete_document(filename: str):
+def delete_document(filename: str, request: Request):
     """Delete a specific document from both filesystem and vector store"""
+    doc_manager = request.app.state.doc_manager
+    rag_engine = request.app.state.rag_engine
     try:
-        print(f"[DELETE] Deleting document: {filename}")
+        delete_logger.info(f"Deleting document: {filename}")
         
         # Delete from filesystem
         file_deleted = doc_manager.delete_document(filename)
@@ -96,14 +204,14 @@ def delete_document(filename: str):
         vector_deleted = rag_engine.delete_document_from_vectorstore(filename)
         
         if vector_deleted:
-            print(f"[DELETE] Successfully deleted {filename} from both filesystem and vectorstore")
+            delete_logger.info(f"Successfully deleted {filename} from both filesystem and vectorstore")
             return {
                 "message": f"Deleted {filename}",
                 "file_deleted": True,
                 "vectorstore_updated": True
             }
         else:
-            print(f"[DELETE] File deleted but vectorstore cleanup failed")
+            delete_logger.warning(f"File deleted but vectorstore cleanup failed")
             return {
                 "message": f"Deleted {filename} (file only, vectorstore cleanup failed)",
                 "file_deleted": True,
@@ -113,26 +221,69 @@ def delete_document(filename: str):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[DELETE] Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        delete_logger.exception(f"Error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/documents/delete")
+def delete_documents(delete: DeleteRequest, request: Request):
+    """Delete several documents at once - one vector store pass for the whole batch"""
+    doc_manager = request.app.state.doc_manager
+    rag_engine = request.app.state.rag_engine
+    try:
+        delete_logger.info(f"Deleting {len(delete.filenames)} documents")
+        deleted = doc_manager.delete_documents(delete.filenames)
+        missing = [filename for filename in delete.filenames if filename not in deleted]
+        
+        vector_deleted = rag_engine.delete_documents_from_vectorstore(deleted) if deleted else True
+        if not vector_deleted:
+            delete_logger.warning(f"Files deleted but vectorstore cleanup failed")
+        return {
+            "message": f"Deleted {len(deleted)} documents",
+            "deleted": deleted,
+            "missing": missing,
+            "vectorstore_updated": vector_deleted
+        }
+    except Exception as e:
+        delete_logger.exception(f"Error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/documents")
-def clear_all_documents():
+def clear_all_documents(request: Request):
     """Clear all documents and vector store"""
-    doc_manager.clear_all_documents()
-    rag_engine.clear_index()
+    request.app.state.doc_manager.clear_all_documents()
+    request.app.state.rag_engine.clear_index()
     return {"message": "All documents cleared"}
 
+@app.post("/flush")
+def flush_index(request: Request):
+    """Embed, index and persist all queued document chunks now"""
+    flushed = request.app.state.rag_engine.flush()
+    return {"message": f"Indexed {flushed} queued chunks", "chunks": flushed}
+
+@app.get("/sources/{filename}/{chunk}")
+def get_source_preview(filename: str, chunk: int, request: Request):
+    """Preview text of one retrieved chunk (query responses only carry its metadata)"""
+    preview = request.app.state.rag_engine.get_source_preview(filename, chunk)
+    if preview is None:
+        raise HTTPException(status_code=404, detail="Chunk not found")
+    return {"filename": filename, "chunk": chunk, "content": preview}
+
 @app.post("/query", response_model=QueryResponse)
-def query_documents(request: QueryRequest):
+def query_documents(query: QueryRequest, request: Request):
     """Query the indexed documents"""
-    result = rag_engine.query(request.question)
+    result = request.app.state.rag_engine.query(query.question)
     return result
 
+@app.post("/query_stream")
+def query_documents_stream(query: QueryRequest, request: Request):
+    """Query the indexed documents, streaming sources then answer tokens as SSE"""
+    return StreamingResponse(
+        request.app.state.rag_engine.aquery_stream(query.question),
+        media_type="text/event-stream"
+    )
+
 @app.get("/health")
-def health_check():
+def health_check(request: Request):
     """Check system health"""
     # Check if API key is configured
     api_key_status = "configured" if config.GROQ_API_KEY else "missing"
@@ -142,16 +293,19 @@ def health_check():
         "llm_provider": "Groq",
         "model": config.GROQ_MODEL,
         "api_key_status": api_key_status,
-        "documents_indexed": len(doc_manager.list_documents())
+        "documents_indexed": len(request.app.state.doc_manager.list_documents())
     }
 
 if __name__ == "__main__":
-    print(f"Starting RAG API with Groq ({config.GROQ_MODEL})")
-    print(f"Maximum upload size: 100MB (configurable)")
+    logging.getLogger("API").info(f"Starting RAG API with Groq ({config.GROQ_MODEL})")
+    logging.getLogger("API").info(f"Maximum upload size: 100MB (configurable)")
     # Increased timeout for large file processing
     uvicorn.run(
-        app, 
+        "main:app", 
         host=config.API_HOST, 
         port=config.API_PORT,
+        workers=config.API_WORKERS,
+        loop="auto",  # uvloop when installed (uvicorn[standard]), asyncio otherwise
+        http="auto",  # httptools when installed, h11 otherwise
         timeout_keep_alive=300  # 5 minutes
     )
\ No newline at end of file
@@ -1,126 +1,607 @@
-from typing import List, Dict, Any, Optional
+import logging
+from typing import List, Dict, Any, Optional, Set, AsyncIterator
+from functools import wraps
 import time
 import re
+import json
+import asyncio
+import threading
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import pickle
+import uuid
+import faiss
+import numpy as np
+import diskcache
+import groq
+from tenacity import AsyncRetrying, Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
 # Modern partner packages
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_groq import ChatGroq
 # Community and Core
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_core.prompts import ChatPromptTemplate
-# Chain construction
-from langchain_classic.chains.retrieval import create_retrieval_chain
-from langchain_classic.chains.combine_documents import create_stuff_documents_chain
+from embeddings import create_embeddings
+from rate_limiter import TokenBucket
+from semantic_cache import SemanticCache
 import config
 
+logger = logging.getLogger("RAG")
+
+SYSTEM_PROMPT = """You are a helpful AI assistant answering questions based on provided documents.
+
+Use ONLY the following context to answer the question. If the answer is not in the context, say "I cannot find this information in the provided documents."
+
+Be concise and accurate. Cite specific parts of the context when possible.
+
+Context: {context}"""
+
+RAG_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", SYSTEM_PROMPT),
+    ("human", "{input}")
+])
+
+# Filename mentions ("summarize report.pdf") and generic phrasings that get
+# reformulated into more specific search queries
+_FILENAME_RE = re.compile(r'\b(\w+\.(?:txt|pdf))\b', re.IGNORECASE)
+_GENERIC_PATTERNS = [
+    (re.compile(pattern, re.IGNORECASE), replacement)
+    for pattern, replacement in [
+        (r'summarize|summarise|summary', 'summary of main topics and key points'),
+        (r'what is in|what\'s in|content of', 'comprehensive overview of content'),
+        (r'tell me about', 'explain'),
+        (r'overview of', 'main information about'),
+    ]
+]
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# Transient Groq failures worth retrying (with jittered exponential backoff)
+_RETRYABLE_LLM_ERRORS = (groq.RateLimitError, groq.APIConnectionError, groq.InternalServerError)
+
+def _llm_retry(can_retry=lambda: True) -> Dict[str, Any]:
+    """tenacity settings for one LLM call; `can_retry` vetoes retries (e.g. mid-stream)"""
+    return dict(
+        retry=retry_if_exception(lambda e: isinstance(e, _RETRYABLE_LLM_ERRORS) and can_retry()),
+        wait=wait_random_exponential(multiplier=0.5, max=8),
+        stop=stop_after_attempt(config.GROQ_MAX_ATTEMPTS),
+        reraise=True,
+    )
+
+def synchronized(method):
+    """Run a RAGEngine method under the engine lock (FAISS isn't thread-safe for writes)"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
 class RAGEngine:
     def __init__(self):
-        # Initialize embeddings (runs locally - no API cost)
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=config.EMBEDDING_MODEL,
-            model_kwargs={'device': 'cpu'}
-        )
+        # Embedding model, LLM client and vectorstore are loaded on first use
+        # so the API can bind its port (and serve /health) immediately
         self.vectorstore = None
-        self.rag_chain = None
+        self._vectorstore_loaded = False
+        self._embeddings: Optional[Embeddings] = None
+        self._llm: Optional[ChatGroq] = None
+        # Warmup and the first requests race to create the models; only one may
+        # (functools.cached_property stopped locking in Python 3.12)
+        self._model_lock = threading.Lock()
+        # Uploads index on worker threads while queries search on others
+        self._lock = threading.RLock()
+        self._index_read_only = False  # True while the index is a read-only mmap
+        self._file_ids: Dict[str, Set[int]] = {}  # filename -> FAISS ids of its chunks
+        self._per_file_indices: Dict[str, FAISS] = {}  # filename -> exact index of just its chunks
+        self._pending: List[Document] = []  # Chunks waiting for the next flush()
         
-        # Initialize Groq LLM (cloud-based)
-        self.llm = ChatGroq(
-            model=config.GROQ_MODEL,
-            groq_api_key=config.GROQ_API_KEY,
-            temperature=config.GROQ_TEMPERATURE,
-            max_retries=2,
-        )
+        # Index snapshots are written to disk off the request path, one at a time;
+        # saves requested while one is queued coalesce into it
+        self._save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="faiss-save")
+        self._save_lock = threading.Lock()  # Serializes disk writes with clear_index
+        self._save_queued = False
+        self._generation = 0  # Bumped by clear_index so stale snapshots are dropped
+        
+        # Persistent chunk embedding cache (survives restarts and index rebuilds)
+        self.embedding_cache = diskcache.Cache(str(config.EMBEDDING_CACHE_DIR))
+        
+        # Client-side view of the Groq quota, so bursts fail fast instead of 429-ing
+        requests_per_minute = config.GROQ_RATE_LIMIT["requests_per_minute"]
+        self.llm_bucket = TokenBucket(rate=requests_per_minute / 60, burst=requests_per_minute)
         
-        print(f"[RAG] Initialized with Groq model: {config.GROQ_MODEL}")
-        print(f"[RAG] Settings: CHUNK_SIZE={config.CHUNK_SIZE}, TOP_K={config.TOP_K_RESULTS}")
+        # Answers for near-duplicate questions
+        self.query_cache = SemanticCache(
+            threshold=config.SEMANTIC_CACHE_THRESHOLD,
+            ttl_seconds=config.SEMANTIC_CACHE_TTL_SECONDS,
+            max_entries=config.SEMANTIC_CACHE_MAX_ENTRIES,
+        )
         
-        # Load existing vectorstore if available
-        self._load_vectorstore()
+        logger.info(f"Initialized with Groq model: {config.GROQ_MODEL}")
+        logger.info(f"Settings: CHUNK_SIZE={config.CHUNK_SIZE}, TOP_K={config.TOP_K_RESULTS}")
+    
+    @property
+    def embeddings(self) -> Embeddings:
+        """Embedding model (runs locally - no API cost, INT8 ONNX on CPU by default)"""
+        if self._embeddings is None:
+            with self._model_lock:
+                if self._embeddings is None:
+                    self._embeddings = create_embeddings()
+        return self._embeddings
+    
+    @property
+    def llm(self) -> ChatGroq:
+        """Groq LLM client (cloud-based)"""
+        if self._llm is None:
+            with self._model_lock:
+                if self._llm is None:
+                    self._llm = ChatGroq(
+                        model=config.GROQ_MODEL,
+                        groq_api_key=config.GROQ_API_KEY,
+                        temperature=config.GROQ_TEMPERATURE,
+                        max_retries=0,  # Retries are handled by tenacity (see _llm_retry)
+                    )
+        return self._llm
+    
+    def warmup(self):
+        """
+        Load the embedding model and index and run one dummy embed + search, so
+        model load and first-inference cost land at startup, not on the first query
+        """
+        try:
+            start_time = time.time()
+            vector = self.embeddings.encode(["warmup"])
+            with self._lock:
+                self._ensure_vectorstore()
+                if self.vectorstore is not None:
+                    # Touch the index so its pages are resident before real queries
+                    self.vectorstore.index.search(vector, 1)
+            logger.info(f"Warmed up in {time.time() - start_time:.2f}s")
+        except Exception as e:
+            logger.warning(f"Warmup failed (first query will load lazily): {e}")
+    
+    def _ensure_vectorstore(self):
+        """Load the persisted vectorstore on first use"""
+        if not self._vectorstore_loaded:
+            self._vectorstore_loaded = True
+            self._load_vectorstore()
     
     def _load_vectorstore(self):
         """Load existing FAISS vectorstore if available"""
         try:
             index_path = str(config.VECTORSTORE_DIR / "faiss_index")
             if (config.VECTORSTORE_DIR / "faiss_index").exists():
-                self.vectorstore = FAISS.load_local(
-                    index_path,
-                    self.embeddings,
-                    allow_dangerous_deserialization=True
-                )
-                self._initialize_rag_chain()
-                print("[RAG] Loaded existing vectorstore")
+                if config.FAISS_MMAP:
+                    # IO_FLAG_MMAP maps only IVF inverted lists; newer faiss builds
+                    # can also map flat code storage (HNSW/SQ vectors) via IO_FLAG_MMAP_IFC
+                    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+                    flags |= getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+                    index = faiss.read_index(
+                        str(config.VECTORSTORE_DIR / "faiss_index" / "index.faiss"), flags
+                    )
+                    with open(config.VECTORSTORE_DIR / "faiss_index" / "index.pkl", "rb") as f:
+                        docstore, index_to_docstore_id = pickle.load(f)
+                    self.vectorstore = FAISS(
+                        embedding_function=self.embeddings,
+                        index=index,
+                        docstore=docstore,
+                        index_to_docstore_id=index_to_docstore_id,
+                        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+                    )
+                    self._index_read_only = True
+                else:
+                    self.vectorstore = FAISS.load_local(
+                        index_path,
+                        self.embeddings,
+                        allow_dangerous_deserialization=True,
+                        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+                    )
+                self._tune_index()
+                self._rebuild_file_ids()
+                logger.info("Loaded existing vectorstore")
         except Exception as e:
-            print(f"[RAG] No existing vectorstore found or error loading: {e}")
+            logger.warning(f"No existing vectorstore found or error loading: {e}")
+    
+    def _ensure_writable(self):
+        """Swap a read-only mmapped index for an in-memory copy before mutating it"""
+        if self._index_read_only:
+            self.vectorstore.index = faiss.read_index(
+                str(config.VECTORSTORE_DIR / "faiss_index" / "index.faiss")
+            )
+            self._index_read_only = False
+            self._tune_index()
+    
+    def _new_vectorstore(self, vectors: np.ndarray) -> FAISS:
+        """
+        Create an empty FAISS store sized for the given embeddings
+        HNSW (inner product, int8 scalar-quantized storage) by default;
+        IVFPQ for large corpora. Quantized indexes are trained on `vectors`,
+        so too few of them to estimate value ranges gets FP32 HNSW instead
+        """
+        num_vectors, dim = vectors.shape
+        if num_vectors >= config.FAISS_IVFPQ_THRESHOLD and dim % config.FAISS_PQ_M == 0:
+            logger.info(f"Training IVFPQ index on {num_vectors} vectors")
+            quantizer = faiss.IndexFlatIP(dim)
+            index = faiss.IndexIVFPQ(
+                quantizer, dim, config.FAISS_IVF_NLIST,
+                config.FAISS_PQ_M, config.FAISS_PQ_NBITS,
+                faiss.METRIC_INNER_PRODUCT
+            )
+            index.train(vectors)
+            index.nprobe = config.FAISS_IVF_NPROBE
+            self._enable_direct_map(index)
+        elif config.FAISS_SCALAR_QUANTIZER and num_vectors >= config.FAISS_SQ_MIN_TRAIN:
+            qtype = getattr(faiss.ScalarQuantizer, config.FAISS_SCALAR_QUANTIZER)
+            index = faiss.IndexHNSWSQ(dim, qtype, config.FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = config.FAISS_HNSW_EF_CONSTRUCTION
+            index.hnsw.efSearch = config.FAISS_HNSW_EF_SEARCH
+            index.train(vectors)
+        else:
+            index = faiss.IndexHNSWFlat(dim, config.FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = config.FAISS_HNSW_EF_CONSTRUCTION
+            index.hnsw.efSearch = config.FAISS_HNSW_EF_SEARCH
+        if not isinstance(index, faiss.IndexIVF):
+            # Explicit ids -> per-file lookups. IVF stores ids itself, and an id map
+            # around it can't reconstruct or remove (it assumes removal renumbers)
+            index = faiss.IndexIDMap2(index)
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=InMemoryDocstore({}),
+            index_to_docstore_id={},
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+        )
+    
+    def _needs_quantizer(self, num_new: int) -> bool:
+        """True if an FP32 HNSW index (built while small) can now be int8-quantized"""
+        if self.vectorstore is None or not config.FAISS_SCALAR_QUANTIZER or not self._has_id_map():
+            return False
+        return (
+            isinstance(self._base_index(), faiss.IndexHNSWFlat)
+            and self.vectorstore.index.ntotal + num_new >= config.FAISS_SQ_MIN_TRAIN
+        )
+    
+    def _has_id_map(self) -> bool:
+        """True if the index is wrapped in an id map"""
+        return isinstance(self.vectorstore.index, (faiss.IndexIDMap, faiss.IndexIDMap2))
+    
+    def _takes_ids(self) -> bool:
+        """True if the index takes explicit ids (indexes saved by older versions don't)"""
+        return self._has_id_map() or isinstance(self.vectorstore.index, faiss.IndexIVF)
+    
+    def _base_index(self):
+        """The underlying search index, unwrapped from its id map"""
+        if self._has_id_map():
+            return faiss.downcast_index(self.vectorstore.index.index)
+        return self.vectorstore.index
+    
+    def _rebuild_file_ids(self):
+        """Derive the filename -> FAISS ids map from the docstore metadata"""
+        self._file_ids = {}
+        self._per_file_indices = {}
+        docs = self.vectorstore.docstore._dict
+        for faiss_id, doc_id in self.vectorstore.index_to_docstore_id.items():
+            filename = docs[doc_id].metadata.get("filename")
+            self._file_ids.setdefault(filename, set()).add(int(faiss_id))
+    
+    @staticmethod
+    def _chunk_ids(documents: List[Document]) -> np.ndarray:
+        """Stable 63-bit FAISS ids derived from (filename, chunk, upload time)"""
+        ids = np.empty(len(documents), dtype=np.int64)
+        for i, doc in enumerate(documents):
+            key = f"{doc.metadata.get('filename')}|{doc.metadata.get('chunk')}|{doc.metadata.get('uploaded_at')}"
+            digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+            ids[i] = int.from_bytes(digest, "little") & 0x7FFFFFFFFFFFFFFF
+        return ids
+    
+    def _tune_index(self):
+        """Apply query-time search settings to a freshly loaded index"""
+        self._set_ef_search(config.FAISS_HNSW_EF_SEARCH)
+        base = self._base_index()
+        if hasattr(base, "nprobe"):
+            base.nprobe = config.FAISS_IVF_NPROBE
+        self._enable_direct_map(base)
+    
+    @staticmethod
+    def _enable_direct_map(index):
+        """
+        Let an IVF index reconstruct vectors by id (index rebuilds need it)
+        Hashtable rather than Array, so remove_ids keeps working
+        """
+        if isinstance(index, faiss.IndexIVF) and index.direct_map.type != faiss.DirectMap.Hashtable:
+            index.set_direct_map_type(faiss.DirectMap.Hashtable)
     
+    def _set_ef_search(self, ef_search: int):
+        """Set HNSW query depth (no-op for indexes saved before HNSW was used)"""
+        hnsw = getattr(self._base_index(), "hnsw", None)
+        if hnsw is not None:
+            hnsw.efSearch = ef_search
+    
+    @synchronized
     def index_documents(self, documents: List[Document]):
-        """Create or update vector store with documents"""
-        print(f"[RAG] Indexing {len(documents)} document chunks...")
+        """
+        Queue documents for indexing
+        They are embedded, added and saved in one batch once INDEX_FLUSH_THRESHOLD
+        chunks are pending, or earlier on the next flush()
+        """
+        logger.info(f"Queuing {len(documents)} document chunks for indexing...")
+        if not documents:
+            logger.info("Nothing to index")
+            return
+        
+        self._pending.extend(documents)
+        if len(self._pending) >= config.INDEX_FLUSH_THRESHOLD:
+            self.flush()
+    
+    @synchronized
+    def known_filenames(self) -> Set[str]:
+        """Files with chunks in the index or still queued for it"""
+        self._ensure_vectorstore()
+        return set(self._file_ids) | {doc.metadata.get("filename") for doc in self._pending}
+    
+    @synchronized
+    def flush(self) -> int:
+        """Embed and add all pending documents in one batch, then save once"""
+        if not self._pending:
+            return 0
+        
+        documents, self._pending = self._pending, []
+        logger.info(f"Indexing {len(documents)} pending document chunks...")
+        self._ensure_vectorstore()
+        self._add_documents(documents)
+        self.query_cache.clear()
+        self._schedule_save()
+        logger.info("Documents indexed successfully")
+        return len(documents)
+    
+    def _schedule_save(self):
+        """Persist the vectorstore in the background (caller holds the lock)"""
+        if not self._save_queued:
+            self._save_queued = True
+            self._save_executor.submit(self._save_snapshot)
+    
+    def _save_snapshot(self):
+        """
+        Write the current index to disk, replacing the previous save atomically
+        Only the in-memory serialization runs under the engine lock; the disk
+        write happens outside it so queries and uploads aren't blocked
+        """
+        try:
+            with self._lock:
+                self._save_queued = False
+                if self.vectorstore is None:
+                    return
+                generation = self._generation
+                index_bytes = faiss.serialize_index(self.vectorstore.index)
+                docstore_bytes = pickle.dumps(
+                    (self.vectorstore.docstore, self.vectorstore.index_to_docstore_id)
+                )
+            
+            with self._save_lock:
+                if generation != self._generation:
+                    return  # Index was cleared while this snapshot was being taken
+                index_dir = config.VECTORSTORE_DIR / "faiss_index"
+                tmp_dir = config.VECTORSTORE_DIR / "faiss_index.tmp"
+                old_dir = config.VECTORSTORE_DIR / "faiss_index.old"
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                tmp_dir.mkdir(parents=True)
+                index_bytes.tofile(str(tmp_dir / "index.faiss"))
+                with open(tmp_dir / "index.pkl", "wb") as f:
+                    f.write(docstore_bytes)
+                
+                # A directory can't be os.replace'd over a non-empty one, so
+                # move the old save aside first, then swap the new one in
+                shutil.rmtree(old_dir, ignore_errors=True)
+                if index_dir.exists():
+                    os.replace(index_dir, old_dir)
+                os.replace(tmp_dir, index_dir)
+                shutil.rmtree(old_dir, ignore_errors=True)
+            logger.info("Vectorstore saved")
+        except Exception as e:
+            logger.error(f"Error saving vectorstore: {e}")
+    
+    def wait_for_save(self):
+        """Block until queued background saves have been written"""
+        self._save_executor.submit(lambda: None).result()
+    
+    def _embedding_key(self, text: str) -> bytes:
+        """
+        Cache key for a chunk embedding
+        Fingerprints the model/backend and chunking settings too, so changing
+        either never serves vectors computed under the old configuration
+        """
+        fingerprint = f"{self.embeddings.fingerprint}|normalized|{config.CHUNK_SIZE}|{config.CHUNK_OVERLAP}|{text}"
+        return hashlib.blake2b(fingerprint.encode("utf-8"), digest_size=16).digest()
+    
+    def _embed_texts(self, texts: List[str]) -> np.ndarray:
+        """Embed texts, computing only the ones missing from the embedding cache"""
+        keys = [self._embedding_key(text) for text in texts]
+        cached = [self.embedding_cache.get(key) for key in keys]
+        misses = [i for i, raw in enumerate(cached) if raw is None]
+        
+        dim = self.embeddings.dimension
+        vectors = np.empty((len(texts), dim), dtype=np.float32)
+        for i, raw in enumerate(cached):
+            if raw is not None:
+                vectors[i] = np.frombuffer(raw, dtype=np.float16)
+        
+        if misses:
+            # Embed all missing chunks in one batched call
+            fresh = self.embeddings.encode([texts[i] for i in misses])
+            vectors[misses] = fresh
+            for i, vector in zip(misses, fresh.astype(np.float16)):  # Half the bytes on disk
+                self.embedding_cache.set(keys[i], vector.tobytes())
+        
+        # Re-normalize in place (cached rows lost a little precision as FP16)
+        faiss.normalize_L2(vectors)
+        logger.debug(f"Embedding cache: {len(texts) - len(misses)} hits, {len(misses)} misses")
+        return vectors
+    
+    def _add_documents(self, documents: List[Document], vectors: Optional[np.ndarray] = None):
+        """
+        Add documents in one batch, creating the store if needed
+        They are embedded here unless their (normalized) vectors are passed in
+        """
+        if vectors is None:
+            vectors = self._embed_texts([doc.page_content for doc in documents])
+        
+        if self._needs_quantizer(len(documents)):
+            # Enough vectors to train the scalar quantizer now: rebuild the
+            # FP32 index as int8 from its stored vectors plus the new ones
+            logger.info("Rebuilding index with int8 scalar quantization")
+            existing_ids = list(self.vectorstore.index_to_docstore_id)
+            existing_docs = [
+                self.vectorstore.docstore._dict[self.vectorstore.index_to_docstore_id[faiss_id]]
+                for faiss_id in existing_ids
+            ]
+            existing_vectors = self._reconstruct_vectors(existing_ids)
+            self.vectorstore = None
+            self._index_read_only = False
+            self._file_ids = {}
+            self._per_file_indices = {}
+            self._add_documents(existing_docs + documents, np.vstack([existing_vectors, vectors]))
+            return
         
         if self.vectorstore is None:
-            self.vectorstore = FAISS.from_documents(documents, self.embeddings)
+            self.vectorstore = self._new_vectorstore(vectors)
         else:
-            self.vectorstore.add_documents(documents)
+            self._ensure_writable()
         
-        # Save vectorstore
-        index_path = str(config.VECTORSTORE_DIR / "faiss_index")
-        self.vectorstore.save_local(index_path)
+        # Hand the contiguous array to FAISS directly (add_embeddings would
+        # rebuild it from per-row lists), then register the docstore entries
+        if self._takes_ids():
+            faiss_ids = self._chunk_ids(documents)
+            self.vectorstore.index.add_with_ids(vectors, faiss_ids)
+        else:
+            start = self.vectorstore.index.ntotal
+            faiss_ids = np.arange(start, start + len(documents), dtype=np.int64)
+            self.vectorstore.index.add(vectors)
         
-        # Initialize RAG chain
-        self._initialize_rag_chain()
-        print("[RAG] Documents indexed successfully")
+        ids = [str(uuid.uuid4()) for _ in documents]
+        self.vectorstore.docstore.add({
+            doc_id: Document(id=doc_id, page_content=doc.page_content, metadata=doc.metadata)
+            for doc_id, doc in zip(ids, documents)
+        })
+        for faiss_id, doc_id, doc in zip(faiss_ids.tolist(), ids, documents):
+            self.vectorstore.index_to_docstore_id[faiss_id] = doc_id
+            self._file_ids.setdefault(doc.metadata.get("filename"), set()).add(faiss_id)
+            self._per_file_indices.pop(doc.metadata.get("filename"), None)  # Rebuilt on next use
+    
+    def _remove_file_ids(self, filename: str) -> bool:
+        """
+        Remove a file's vectors in place by id - O(chunks in file)
+        Only IVF indexes support this; returns False for the rest (HNSW graphs
+        can't drop nodes), so the caller rebuilds
+        """
+        if not isinstance(self.vectorstore.index, faiss.IndexIVF):
+            return False
+        
+        faiss_ids = sorted(self._file_ids.get(filename, ()))
+        self._ensure_writable()
+        # The Hashtable direct map only accepts an IDSelectorArray
+        id_array = np.array(faiss_ids, dtype=np.int64)
+        try:
+            self.vectorstore.index.remove_ids(faiss.IDSelectorArray(len(id_array), faiss.swig_ptr(id_array)))
+        except RuntimeError:
+            logger.exception(f"Removing {filename} by id failed, rebuilding instead")
+            return False
+        
+        doc_ids = [self.vectorstore.index_to_docstore_id.pop(faiss_id) for faiss_id in faiss_ids]
+        self.vectorstore.docstore.delete(doc_ids)
+        del self._file_ids[filename]
+        self._per_file_indices.pop(filename, None)
+        return True
+    
+    def _reconstruct_vectors(self, faiss_ids: List[int]) -> np.ndarray:
+        """Read stored vectors back out of the index (no re-embedding)"""
+        vectors = self.vectorstore.index.reconstruct_batch(np.array(faiss_ids, dtype=np.int64))
+        faiss.normalize_L2(vectors)  # Quantized storage decodes slightly off unit length
+        return vectors
     
     def delete_document_from_vectorstore(self, filename: str) -> bool:
+        """Delete all chunks belonging to a specific file from the vector store"""
+        return self.delete_documents_from_vectorstore([filename])
+    
+    @synchronized
+    def delete_documents_from_vectorstore(self, filenames: List[str]) -> bool:
         """
-        Delete all chunks belonging to a specific file from the vector store
-        FAISS doesn't support direct deletion, so we rebuild the index
+        Delete all chunks belonging to the given files from the vector store
+        Removed by id when the index supports it, otherwise the index is rebuilt
+        once for the whole batch
         """
+        targets = set(filenames)
+        # Drop the files' queued chunks, then index the rest so the rebuild sees them
+        pending_count = len(self._pending)
+        self._pending = [doc for doc in self._pending if doc.metadata.get("filename") not in targets]
+        removed_pending = pending_count - len(self._pending)
+        self.flush()
+        
+        self._ensure_vectorstore()
         if self.vectorstore is None:
-            print(f"[RAG] No vectorstore exists, nothing to delete")
+            if removed_pending:
+                logger.info(f"Dropped {removed_pending} queued chunks for {len(targets)} file(s)")
+                return True
+            logger.info(f"No vectorstore exists, nothing to delete")
             return False
         
         try:
-            print(f"[RAG] Deleting chunks for: {filename}")
+            logger.info(f"Deleting chunks for: {', '.join(sorted(targets))}")
             
-            # Get all documents from the vectorstore
-            # We need to rebuild without the deleted file's chunks
+            # Split the indexed chunks into the deleted files' and the rest
             all_docs = self.vectorstore.docstore._dict
-            
-            # Filter out documents from the deleted file
+            remaining_ids = []
             remaining_docs = []
             deleted_count = 0
             
-            for doc_id, doc in all_docs.items():
-                if doc.metadata.get("filename") != filename:
+            for faiss_id, doc_id in self.vectorstore.index_to_docstore_id.items():
+                doc = all_docs[doc_id]
+                if doc.metadata.get("filename") not in targets:
+                    remaining_ids.append(faiss_id)
                     remaining_docs.append(doc)
                 else:
                     deleted_count += 1
             
-            print(f"[RAG] Found {deleted_count} chunks to delete")
+            logger.info(f"Found {deleted_count} chunks to delete")
+            
+            if deleted_count == 0:
+                # Nothing indexed for these files: leave the index (and its save) alone
+                return bool(removed_pending)
             
             if len(remaining_docs) == 0:
                 # No documents left, clear the vectorstore
-                print(f"[RAG] No documents remaining, clearing vectorstore")
+                logger.info(f"No documents remaining, clearing vectorstore")
                 self.clear_index()
                 return True
             
-            # Rebuild vectorstore with remaining documents
-            print(f"[RAG] Rebuilding vectorstore with {len(remaining_docs)} remaining chunks")
-            self.vectorstore = FAISS.from_documents(remaining_docs, self.embeddings)
-            
-            # Save the updated vectorstore
-            index_path = str(config.VECTORSTORE_DIR / "faiss_index")
-            self.vectorstore.save_local(index_path)
+            indexed = [filename for filename in targets if filename in self._file_ids]
+            if all(self._remove_file_ids(filename) for filename in indexed):
+                self.query_cache.clear()
+                self._schedule_save()
+                logger.info(f"Removed {deleted_count} chunks by id")
+                return True
             
-            # Reinitialize RAG chain
-            self._initialize_rag_chain()
+            # Index can't remove ids (HNSW): rebuild from the stored vectors of the
+            # remaining chunks - no re-embedding, so cost is the graph build only
+            logger.info(f"Rebuilding vectorstore with {len(remaining_docs)} remaining chunks")
+            vectors = self._reconstruct_vectors(remaining_ids)
+            self.vectorstore = None
+            self._index_read_only = False
+            self._file_ids = {}
+            self._per_file_indices = {}
+            self._add_documents(remaining_docs, vectors)
+            self.query_cache.clear()
+            self._schedule_save()
             
-            print(f"[RAG] Successfully deleted {deleted_count} chunks from {filename}")
+            logger.info(f"Successfully deleted {deleted_count} chunks")
             return True
             
         except Exception as e:
-            print(f"[RAG] Error deleting document from vectorstore: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Error deleting documents from vectorstore: {e}")
             return False
     
     def _extract_filename_from_query(self, query: str) -> Optional[str]:
@@ -131,13 +612,10 @@ class RAGEngine:
         - "Summarize document.pdf"
         - "What does the report.txt say?"
         """
-        # Pattern to match common file extensions
-        pattern = r'\b(\w+\.(txt|pdf))\b'
-        match = re.search(pattern, query, re.IGNORECASE)
-        
+        match = _FILENAME_RE.search(query)
         if match:
             filename = match.group(1)
-            print(f"[RAG] Detected filename in query: {filename}")
+            logger.debug(f"Detected filename in query: {filename}")
             return filename
         
         return None
@@ -150,198 +628,341 @@ class RAGEngine:
 
         # Strip filename once at the start
         if filename:
-            search_query = re.sub(r'\b\w+\.(txt|pdf)\b', '', query, flags=re.IGNORECASE).strip()
-        
-        # Generic query patterns that need reformulation
-        generic_patterns = {
-            r'summarize|summarise|summary': 'summary of main topics and key points',
-            r'what is in|what\'s in|content of': 'comprehensive overview of content',
-            r'tell me about': 'explain',
-            r'overview of': 'main information about',
-        }
+            search_query = _FILENAME_RE.sub('', query).strip()
         
         # Check if query is generic
-        for pattern, replacement in generic_patterns.items():
-            if re.search(pattern, search_query.lower()):
+        for pattern, replacement in _GENERIC_PATTERNS:
+            if pattern.search(search_query):
                 final_query = f"{search_query}, {replacement}".strip()
-                print(f"[RAG] Reformulated query: '{search_query}' -> '{final_query}'")
+                logger.debug(f"Reformulated query: '{search_query}' -> '{final_query}'")
                 return final_query
                     
         return search_query
     
-    def _initialize_rag_chain(self):
-        """Initialize the RAG chain with custom prompt"""
-        system_prompt = """You are a helpful AI assistant answering questions based on provided documents.
-
-Use ONLY the following context to answer the question. If the answer is not in the context, say "I cannot find this information in the provided documents."
-
-Be concise and accurate. Cite specific parts of the context when possible.
-
-Context: {context}"""
-        
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_prompt),
-            ("human", "{input}")
-        ])
-        
-        # Create the combine documents chain
-        combine_docs_chain = create_stuff_documents_chain(self.llm, prompt)
-        
-        # Create the retrieval chain with base retriever (no filtering yet)
-        base_retriever = self.vectorstore.as_retriever(
-            search_kwargs={"k": config.TOP_K_RESULTS}
-        )
-        
-        self.rag_chain = create_retrieval_chain(
-            base_retriever,
-            combine_docs_chain
+    def _file_index(self, filename: str) -> Optional[FAISS]:
+        """
+        Exact (flat inner-product) index over one file's chunks, built on first use
+        from the vectors already stored in the main index; shares its docstore
+        Not for IVF indexes - see _search_file_ids
+        """
+        if filename not in self._per_file_indices:
+            faiss_ids = sorted(self._file_ids.get(filename, ()))
+            if not faiss_ids:
+                return None
+            vectors = self._reconstruct_vectors(faiss_ids)
+            index = faiss.IndexFlatIP(vectors.shape[1])
+            index.add(vectors)
+            self._per_file_indices[filename] = FAISS(
+                embedding_function=self.embeddings,
+                index=index,
+                docstore=self.vectorstore.docstore,
+                index_to_docstore_id={
+                    position: self.vectorstore.index_to_docstore_id[faiss_id]
+                    for position, faiss_id in enumerate(faiss_ids)
+                },
+                distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+            )
+        return self._per_file_indices[filename]
+    
+    @staticmethod
+    def _search(store: FAISS, vector: np.ndarray, k: int) -> List[Document]:
+        """
+        Top-k inner-product search with an already normalized query vector
+        (straight to FAISS - no list round trip or per-query normalization)
+        """
+        _, faiss_ids = store.index.search(vector.reshape(1, -1), k)
+        docs = store.docstore._dict
+        return [
+            docs[store.index_to_docstore_id[faiss_id]]
+            for faiss_id in faiss_ids[0].tolist()
+            if faiss_id != -1
+        ]
+    
+    def _search_file_ids(self, vector: np.ndarray, faiss_ids: Set[int], k: int) -> List[Document]:
+        """
+        Top-k search of the main IVF index restricted to the given ids
+        (scores the stored codes directly, so no per-file copy is built).
+        Every list is probed, since a file's chunks can sit in any of them
+        """
+        params = faiss.SearchParametersIVF(
+            sel=faiss.IDSelectorBatch(np.fromiter(faiss_ids, dtype=np.int64, count=len(faiss_ids))),
+            nprobe=self._base_index().nlist,
         )
-        print("[RAG] RAG chain initialized")
-
+        _, found = self.vectorstore.index.search(vector.reshape(1, -1), k, params=params)
+        docs = self.vectorstore.docstore._dict
+        return [
+            docs[self.vectorstore.index_to_docstore_id[faiss_id]]
+            for faiss_id in found[0].tolist()
+            if faiss_id != -1
+        ]
+    
+    @synchronized
     def _get_filtered_documents(self, query: str, filename: str) -> List[Document]:
-        """Get documents filtered by filename using native FAISS filtering"""
-        return self.vectorstore.similarity_search(
-            query, 
-            k=config.TOP_K_RESULTS, 
-            filter={'filename': filename},
-            fetch_k=200  # Deep dive to ensure we find chunks from this specific file
-        )
+        """Get documents from one file, searching only that file's chunks"""
+        faiss_ids = self._file_ids.get(filename)
+        if not faiss_ids:
+            return []
+        vector = self.embeddings.encode([query])[0]
+        if isinstance(self._base_index(), faiss.IndexIVF):
+            return self._search_file_ids(vector, faiss_ids, config.TOP_K_RESULTS)
+        return self._search(self._file_index(filename), vector, config.TOP_K_RESULTS)
     
-    def query(self, question: str) -> Dict[str, Any]:
-        """Query the RAG system with optional filename filtering"""
+    @staticmethod
+    def _no_chunks_response(filename: str) -> Dict[str, Any]:
+        """Response for a filename-filtered query that matched no chunks"""
+        return {
+            "answer": f"No relevant information found in {filename}. The file might be empty or the question might not match the content.",
+            "sources": [],
+            "filtered_by": filename,
+            "chunks_retrieved": 0
+        }
+    
+    def _prepare_query(self, question: str) -> Dict[str, Any]:
+        """
+        Everything in a query up to the LLM call (cache lookup, filtering, retrieval)
+        Returns {"response": ...} when no LLM call is needed, otherwise the prompt
+        plus the sources/metadata the final response is built from
+        """
+        self.flush()
+        self._ensure_vectorstore()
         if self.vectorstore is None:
-            return {
+            return {"response": {
                 "answer": "No documents indexed yet. Please upload a document first.",
                 "sources": [],
                 "filtered_by": None
-            }
+            }}
         
-        try:
-            print(f"[RAG] Processing query: {question}")
+        logger.info(f"Processing query: {question}")
+        
+        # Check if user mentioned a specific file
+        target_filename = self._extract_filename_from_query(question)
+        if target_filename and target_filename not in self._file_ids:
+            # Nothing indexed under that name: skip the embedding and search entirely
+            logger.info(f"No chunks found for {target_filename}")
+            return {"response": self._no_chunks_response(target_filename)}
+        
+        # Near-duplicate of a recent question -> reuse its answer. The generation
+        # is read first, so an answer to documents changed mid-query isn't cached
+        cache_generation = self.query_cache.generation
+        question_vector = self.embeddings.encode([question])[0]  # Unit length, float32
+        cached = self.query_cache.get(question_vector, target_filename)
+        if cached is not None:
+            logger.info("Semantic cache hit")
+            return {"response": cached}
+        
+        if target_filename:
+            # Reformulate query for better semantic search
+            search_query = self._reformulate_query_for_search(question, target_filename)
             
-            # Check if user mentioned a specific file
-            target_filename = self._extract_filename_from_query(question)
+            logger.info(f"Filtering search to file: {target_filename}")
+            logger.debug(f"Search query: {search_query}")
             
-            if target_filename:
-                # Reformulate query for better semantic search
-                search_query = self._reformulate_query_for_search(question, target_filename)
-                
-                print(f"[RAG] Filtering search to file: {target_filename}")
-                print(f"[RAG] Search query: {search_query}")
-                
-                # Get filtered documents
-                filtered_docs = self._get_filtered_documents(search_query, target_filename)
-                num_chunks = len(filtered_docs)
-
-                if num_chunks == 0:
-                    print(f"[RAG] No chunks found for {target_filename}")
-                    return {
-                        "answer": f"No relevant information found in {target_filename}. The file might be empty or the question might not match the content.",
-                        "sources": [],
-                        "filtered_by": target_filename,
-                        "chunks_retrieved": 0
-                    }
-                
-                print(f"[RAG] Found {num_chunks} chunks from {target_filename}")
-                
-                # Format context for LLM
-                context_text = "\n\n".join([doc.page_content for doc in filtered_docs])
-                
-                # Create prompt
-                prompt_text = f"""You are a helpful AI assistant answering questions based on provided documents.
-
-Use ONLY the following context to answer the question. If the answer is not in the context, say "I cannot find this information in the provided documents."
-
-Be concise and accurate. Cite specific parts of the context when possible.
+            # Get filtered documents
+            docs = self._get_filtered_documents(search_query, target_filename)
+            num_chunks = len(docs)
 
-Context: {context_text}
-
-Question: {search_query}"""
-                
-                # Query LLM directly
-                start_time = time.time()
-                response = self.llm.invoke(prompt_text)
-                elapsed = time.time() - start_time
-                
-                answer = response.content if hasattr(response, 'content') else str(response)
-                
-                print(f"[RAG] Response received in {elapsed:.2f}s (filtered by {target_filename})")
-                
-                # Format sources
-                sources = []
-                for doc in filtered_docs:
-                    sources.append({
-                        "content": doc.page_content[:200] + "...",
-                        "source": doc.metadata.get("source", "Unknown"),
-                        "filename": doc.metadata.get("filename", "Unknown"),
-                        "chunk": doc.metadata.get("chunk", 0),
-                        "file_type": doc.metadata.get("file_type", "unknown")
-                    })
-                
-                return {
-                    "answer": answer,
-                    "sources": sources,
-                    "filtered_by": target_filename,
-                    "chunks_retrieved": len(sources)
-                }
-            else:
-                # Use normal retrieval across all documents
-                start_time = time.time()
-                result = self.rag_chain.invoke({"input": question})
-                elapsed = time.time() - start_time
-                print(f"[RAG] Response received in {elapsed:.2f}s (no filtering)")
-                
-                # Format sources with metadata
-                sources = []
-                for doc in result.get("context", []):
-                    sources.append({
-                        "content": doc.page_content[:200] + "...",
-                        "source": doc.metadata.get("source", "Unknown"),
-                        "filename": doc.metadata.get("filename", "Unknown"),
-                        "chunk": doc.metadata.get("chunk", 0),
-                        "file_type": doc.metadata.get("file_type", "unknown")
-                    })
-                
-                return {
-                    "answer": result["answer"],
-                    "sources": sources,
-                    "filtered_by": None,
-                    "chunks_retrieved": len(sources)
-                }
+            if num_chunks == 0:
+                logger.info(f"No chunks found for {target_filename}")
+                return {"response": self._no_chunks_response(target_filename)}
+            
+            logger.info(f"Found {num_chunks} chunks from {target_filename}")
+        else:
+            # Use normal retrieval across all documents, reusing the question embedding
+            search_query = question
+            with self._lock:
+                docs = self._search(self.vectorstore, question_vector, config.TOP_K_RESULTS)
+        
+        docs = self._dedupe_documents(docs)
+        
+        # Same prompt template for filtered and unfiltered retrieval
+        context_text = "\n\n".join(doc.page_content for doc in docs)
+        prompt = RAG_PROMPT.invoke({"context": context_text, "input": search_query})
+        
+        return {
+            "prompt": prompt,
+            "sources": self._format_sources(docs),
+            "filtered_by": target_filename,
+            "question_vector": question_vector,
+            "cache_generation": cache_generation,
+        }
+    
+    @staticmethod
+    def _dedupe_documents(docs: List[Document]) -> List[Document]:
+        """
+        Drop retrieved chunks whose full text repeats an earlier one (e.g. a file
+        uploaded twice) so no prompt tokens are wasted; chunks that merely share
+        a header are kept
+        """
+        seen = set()
+        kept = []
+        for doc in docs:
+            key = hashlib.blake2b(doc.page_content.encode("utf-8"), digest_size=16).digest()
+            if key in seen:
+                continue
+            seen.add(key)
+            kept.append(doc)
+        if len(kept) < len(docs):
+            logger.info(f"Dropped {len(docs) - len(kept)} duplicate chunks from context")
+        return kept
+    
+    @staticmethod
+    def _preview(text: str) -> str:
+        """First 200 chars of a chunk"""
+        return text if len(text) <= 200 else text[:200] + "..."
+    
+    @staticmethod
+    def _format_sources(docs: List[Document]) -> List[Dict[str, Any]]:
+        """
+        Source metadata for the response; the text itself is left out and
+        fetched on demand via get_source_preview (most sources are never opened)
+        """
+        return [
+            {
+                "source": doc.metadata.get("source", "Unknown"),
+                "filename": doc.metadata.get("filename", "Unknown"),
+                "chunk": doc.metadata.get("chunk", 0),
+                "file_type": doc.metadata.get("file_type", "unknown")
+            }
+            for doc in docs
+        ]
+    
+    @staticmethod
+    def _scope(prepared: Dict[str, Any]) -> str:
+        """Log label for the retrieval scope of a prepared query"""
+        return f"filtered by {prepared['filtered_by']}" if prepared["filtered_by"] else "no filtering"
+    
+    def _finish_query(self, prepared: Dict[str, Any], answer: str) -> Dict[str, Any]:
+        """Build the response for a generated answer and remember it in the cache"""
+        result = {
+            "answer": answer,
+            "sources": prepared["sources"],
+            "filtered_by": prepared["filtered_by"],
+            "chunks_retrieved": len(prepared["sources"])
+        }
+        self.query_cache.put(
+            prepared["question_vector"], prepared["filtered_by"], result,
+            generation=prepared["cache_generation"]
+        )
+        return result
+    
+    def _error_response(self, error: Exception) -> Dict[str, Any]:
+        """Map a query failure to a user-facing response"""
+        error_msg = str(error)
+        logger.error(f"Error: {error_msg}")
+        
+        # Handle specific Groq errors
+        if "rate_limit" in error_msg.lower():
+            answer = "Rate limit exceeded. Please wait a moment and try again. (Groq free tier: 30 requests/min)"
+        elif "api_key" in error_msg.lower() or "authentication" in error_msg.lower():
+            answer = "API authentication error. Please check your GROQ_API_KEY in the .env file."
+        else:
+            answer = f"Error processing query: {error_msg}"
+        return {"answer": answer, "sources": [], "filtered_by": None}
+    
+    @staticmethod
+    def _rate_limited_response(prepared: Dict[str, Any]) -> Dict[str, Any]:
+        """Response when the client-side Groq quota is used up"""
+        logger.warning("Client-side rate limit reached, skipping LLM call")
+        return {
+            "answer": "Rate limit reached (Groq free tier: 30 requests/min). Please wait a few seconds and try again.",
+            "sources": [],
+            "filtered_by": prepared["filtered_by"]
+        }
+    
+    def query(self, question: str) -> Dict[str, Any]:
+        """Query the RAG system with optional filename filtering"""
+        try:
+            prepared = self._prepare_query(question)
+            if "response" in prepared:
+                return prepared["response"]
+            if not self.llm_bucket.try_acquire():
+                return self._rate_limited_response(prepared)
             
+            start_time = time.time()
+            for attempt in Retrying(**_llm_retry()):
+                with attempt:
+                    answer = self.llm.invoke(prepared["prompt"]).content
+            elapsed = time.time() - start_time
+            logger.info(f"Response received in {elapsed:.2f}s ({self._scope(prepared)})")
+            
+            return self._finish_query(prepared, answer)
         except Exception as e:
-            error_msg = str(e)
-            print(f"[RAG] Error: {error_msg}")
+            return self._error_response(e)
+    
+    async def aquery_stream(self, question: str) -> AsyncIterator[str]:
+        """
+        Query as Server-Sent Events: a `sources` event (sent before the LLM call),
+        one `token` event per streamed answer chunk, then `done` (or `error`)
+        """
+        try:
+            # Retrieval is CPU-bound; keep it off the event loop
+            prepared = await asyncio.to_thread(self._prepare_query, question)
+            if "response" in prepared:
+                response = prepared["response"]
+                yield _sse("sources", {
+                    "sources": response["sources"],
+                    "filtered_by": response.get("filtered_by"),
+                    "chunks_retrieved": response.get("chunks_retrieved", 0)
+                })
+                yield _sse("token", {"text": response["answer"]})
+                yield _sse("done", {})
+                return
+            if not self.llm_bucket.try_acquire():
+                yield _sse("error", self._rate_limited_response(prepared))
+                return
+            
+            yield _sse("sources", {
+                "sources": prepared["sources"],
+                "filtered_by": prepared["filtered_by"],
+                "chunks_retrieved": len(prepared["sources"])
+            })
             
-            # Handle specific Groq errors
-            if "rate_limit" in error_msg.lower():
-                return {
-                    "answer": "Rate limit exceeded. Please wait a moment and try again. (Groq free tier: 30 requests/min)",
-                    "sources": [],
-                    "filtered_by": None
-                }
-            elif "api_key" in error_msg.lower() or "authentication" in error_msg.lower():
-                return {
-                    "answer": "API authentication error. Please check your GROQ_API_KEY in the .env file.",
-                    "sources": [],
-                    "filtered_by": None
-                }
-            else:
-                return {
-                    "answer": f"Error processing query: {error_msg}",
-                    "sources": [],
-                    "filtered_by": None
-                }
+            start_time = time.time()
+            parts = []
+            # Retry only until the first token is out - after that a retry would repeat text
+            async for attempt in AsyncRetrying(**_llm_retry(lambda: not parts)):
+                with attempt:
+                    async for chunk in self.llm.astream(prepared["prompt"]):
+                        if chunk.content:
+                            parts.append(chunk.content)
+                            yield _sse("token", {"text": chunk.content})
+            elapsed = time.time() - start_time
+            logger.info(f"Streamed response in {elapsed:.2f}s ({self._scope(prepared)})")
+            
+            self._finish_query(prepared, "".join(parts))
+            yield _sse("done", {})
+        except Exception as e:
+            yield _sse("error", self._error_response(e))
+    
+    @synchronized
+    def get_source_preview(self, filename: str, chunk: int) -> Optional[str]:
+        """Preview text of one indexed chunk, or None if it isn't indexed"""
+        self._ensure_vectorstore()
+        if self.vectorstore is None:
+            return None
+        docs = self.vectorstore.docstore._dict
+        for faiss_id in self._file_ids.get(filename, ()):
+            doc = docs[self.vectorstore.index_to_docstore_id[faiss_id]]
+            if doc.metadata.get("chunk") == chunk:
+                return self._preview(doc.page_content)
+        return None
     
+    @synchronized
     def clear_index(self):
         """Clear the vector store"""
         self.vectorstore = None
-        self.rag_chain = None
+        self._vectorstore_loaded = True
+        self._index_read_only = False
+        self._file_ids = {}
+        self._per_file_indices = {}
+        self._pending = []
+        self.query_cache.clear()
         
-        # Delete saved index
-        index_path = config.VECTORSTORE_DIR / "faiss_index"
-        if index_path.exists():
-            import shutil
-            shutil.rmtree(config.VECTORSTORE_DIR)
-            config.VECTORSTORE_DIR.mkdir(parents=True, exist_ok=True)
-        print("[RAG] Vector store cleared")
\ No newline at end of file
+        # Delete saved index (after any in-progress background write)
+        with self._save_lock:
+            self._generation += 1
+            index_path = config.VECTORSTORE_DIR / "faiss_index"
+            if index_path.exists():
+                shutil.rmtree(config.VECTORSTORE_DIR)
+                config.VECTORSTORE_DIR.mkdir(parents=True, exist_ok=True)
+        logger.info("Vector store cleared")
\ No newline at end of file
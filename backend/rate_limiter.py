@@ -0,0 +1,27 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second refill, up to `burst`
+    Callers that find it empty fail fast instead of queueing behind the
+    provider's own 429 backoff
+    """
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        """Take one token if available"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
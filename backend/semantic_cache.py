@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import faiss
+import numpy as np
+
+
+class SemanticCache:
+    """
+    LRU cache of query responses looked up by embedding similarity
+    A new question whose (normalized) embedding has cosine >= threshold with a
+    cached one, and targets the same file, reuses the stored response
+    Thread-safe; `generation` changes on every clear(), so a response computed
+    before a clear can be dropped instead of cached (see put)
+    """
+    def __init__(self, threshold: float, ttl_seconds: float, max_entries: int):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.index = None  # Created on first insert, once the embedding dim is known
+        self.entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, query_vector: np.ndarray, filename: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Return the cached response for a near-duplicate query, if still fresh"""
+        with self._lock:
+            if not self.entries:
+                return None
+
+            scores, ids = self.index.search(query_vector.reshape(1, -1), 1)
+            entry_id = int(ids[0][0])
+            if entry_id == -1 or scores[0][0] < self.threshold:
+                return None
+
+            entry = self.entries.get(entry_id)
+            if entry is None:
+                return None
+            if time.time() - entry["ts"] > self.ttl_seconds:
+                self._remove(entry_id)
+                return None
+            if entry["filename"] != filename:
+                return None
+
+            self.entries.move_to_end(entry_id)
+            return entry["response"]
+
+    def put(self, query_vector: np.ndarray, filename: Optional[str], response: Dict[str, Any],
+            generation: Optional[int] = None):
+        """
+        Store a response, evicting the least recently used entry when full
+        Skipped if `generation` (read before the response was computed) is stale
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if self.index is None:
+                # IDMap2 over a flat IP index so evicted entries can be removed by id
+                self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(query_vector.shape[-1]))
+
+            while len(self.entries) >= self.max_entries:
+                self._remove(next(iter(self.entries)))
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self.index.add_with_ids(query_vector.reshape(1, -1), np.array([entry_id], dtype=np.int64))
+            self.entries[entry_id] = {"filename": filename, "response": response, "ts": time.time()}
+
+    def clear(self):
+        """Drop all entries (call whenever the indexed documents change)"""
+        with self._lock:
+            self.generation += 1
+            if self.index is not None:
+                self.index.reset()
+            self.entries.clear()
+
+    def _remove(self, entry_id: int):
+        """Drop one entry (caller holds the lock)"""
+        self.index.remove_ids(np.array([entry_id], dtype=np.int64))
+        del self.entries[entry_id]
@@ -1,35 +1,428 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import requests
+from requests.adapters import HTTPAdapter
+from requests_toolbelt.multipart.encoder import MultipartEncoder
+from urllib3.util import Retry
+import html
 import json
+import orjson
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
+from urllib.parse import quote
 from datetime import datetime
+from typing import Optional
+from uuid import uuid4
+from concurrent.futures import ThreadPoolExecutor
+
+# POSIX advisory file locks; on Windows transcript appends go unlocked
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 # Backend API URL
 API_URL = "http://localhost:8000"
 
+# (connect, read) timeouts: a dead backend is detected within CONNECT_TIMEOUT,
+# while slow reads (indexing big uploads, LLM answers) still get their full time
+CONNECT_TIMEOUT = 2.0
+QUICK_TIMEOUT = (CONNECT_TIMEOUT, 3)     # /health, /documents, /sources
+
+# How long cached backend reads stay fresh (uploads/deletes here invalidate them
+# immediately; the TTL only bounds staleness from changes made elsewhere)
+HEALTH_TTL_SECONDS = 10
+DOCUMENTS_TTL_SECONDS = 30
+
+# Files above this size are sent as a series of smaller requests (proxies often
+# cap request bodies at ~100 MB) with a progress bar
+CHUNKED_UPLOAD_THRESHOLD = 100 * 1024 * 1024
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024
+
+# Answers to repeated questions (same documents) are reused without a backend call
+ANSWER_CACHE_TTL_SECONDS = 3600
+ANSWER_CACHE_MAX_ENTRIES = 256
+# Only the most recent turns are kept in session state; fewer are rendered
+# until the user asks for older ones
+CHAT_HISTORY_MAX_TURNS = 50
+VISIBLE_TURNS = 20
+# Per-turn sources kept outside session state (shared by all sessions); turns
+# not rendered for a day, or beyond the cap, are dropped least recently used first
+SOURCES_STORE_MAX_ENTRIES = 5000
+SOURCES_STORE_TTL_SECONDS = 24 * 3600
+
 # --- Chat Persistence (survives refresh) ---
-CHAT_HISTORY_PATH = Path(__file__).parent.parent / "data" / "chat_history.json"
+# Append-only transcript: one JSON turn per line, so saving a turn never
+# rewrites the ones already on disk
+CHAT_HISTORY_PATH = Path(__file__).parent.parent / "data" / "chat_history.jsonl"
 CHAT_HISTORY_PATH.parent.mkdir(parents=True, exist_ok=True)
 
+class SourcesStore:
+    """
+    Thread-safe LRU of turn_id -> sources list
+    Entries not read for ttl_seconds (e.g. from sessions that have ended)
+    are evicted along with any beyond max_entries
+    """
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # turn_id -> (last used, sources)
+        self._lock = threading.Lock()
+
+    def get(self, turn_id: str) -> list:
+        with self._lock:
+            entry = self._entries.get(turn_id)
+            if entry is None:
+                return []
+            self._entries[turn_id] = (time.time(), entry[1])
+            self._entries.move_to_end(turn_id)
+            return entry[1]
+
+    def put(self, turn_id: str, sources: list):
+        now = time.time()
+        with self._lock:
+            self._entries[turn_id] = (now, sources)
+            self._entries.move_to_end(turn_id)
+            while self._entries:
+                oldest_id, (last_used, _) = next(iter(self._entries.items()))
+                if len(self._entries) <= self.max_entries and now - last_used <= self.ttl_seconds:
+                    break
+                del self._entries[oldest_id]
+
+    def pop(self, turn_id: str):
+        with self._lock:
+            self._entries.pop(turn_id, None)
+
+@st.cache_resource
+def sources_store() -> SourcesStore:
+    """
+    Process-wide store for the bulky per-turn sources, kept out of session
+    state (which Streamlit walks on every rerun)
+    """
+    return SourcesStore(SOURCES_STORE_MAX_ENTRIES, SOURCES_STORE_TTL_SECONDS)
+
+def stash_sources(turn: dict) -> dict:
+    """
+    Move a turn's sources into sources_store(), leaving a turn_id behind
+    Every session gets fresh ids, even for turns loaded from the shared
+    transcript, so clearing or evicting in one session never touches another's
+    """
+    stored = {key: value for key, value in turn.items() if key not in ("sources", "turn_id")}
+    stored["turn_id"] = uuid4().hex
+    sources_store().put(stored["turn_id"], turn.get("sources", []))
+    return stored
+
+def read_tail_lines(path: Path, n: int, block_size: int = 64 * 1024) -> list:
+    """Last `n` lines of a file, reading backwards in blocks (cost doesn't grow with file length)"""
+    with open(path, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        data = b""
+        # n whole lines need n + 1 newlines (the one ending the line before them)
+        while pos > 0 and data.count(b"\n") <= n:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    return data.splitlines()[-n:]
+
 def load_chat_history() -> list:
-    """Load chat history from disk. Returns empty list if file missing or corrupt."""
+    """Load the most recent turns from disk. Skips corrupt lines (e.g. a write cut short by a crash)."""
+    turns = []
     try:
         if CHAT_HISTORY_PATH.exists():
-            with open(CHAT_HISTORY_PATH, "r", encoding="utf-8") as f:
-                return json.load(f)
-    except (json.JSONDecodeError, OSError):
+            for line in read_tail_lines(CHAT_HISTORY_PATH, CHAT_HISTORY_MAX_TURNS):
+                if not line.strip():
+                    continue
+                try:
+                    turns.append(json.loads(line))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    pass
+    except OSError:
         pass
-    return []
-
-def save_chat_history(history: list):
-    """Write current chat history to disk."""
-    with open(CHAT_HISTORY_PATH, "w", encoding="utf-8") as f:
-        json.dump(history, f, ensure_ascii=False, indent=2)
+    return [stash_sources(turn) for turn in turns]
+
+@st.cache_resource
+def chat_writer() -> ThreadPoolExecutor:
+    """
+    Single background thread for transcript writes: they stay in order, run
+    off the submit path, and pending ones finish before the process exits
+    """
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-writer")
+
+def save_chat_turn(turn: dict):
+    """
+    Append one turn (sources included) to the transcript on disk.
+    Locked so several Streamlit processes never interleave their lines
+    """
+    line = (json.dumps(turn, ensure_ascii=False) + "\n").encode("utf-8")
+    with open(CHAT_HISTORY_PATH, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        # Start on a fresh line if an earlier write was cut short by a crash,
+        # so only that torn line is skipped on load, not this one too
+        if f.seek(0, os.SEEK_END) > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                line = b"\n" + line
+        f.write(line)
+        f.flush()
+
+def append_chat_turn(turn: dict) -> dict:
+    """
+    Add a turn to the session's history, dropping (and freeing) the oldest beyond the cap
+    Returns the stored turn (sources replaced by its turn_id)
+    """
+    chat_writer().submit(save_chat_turn, turn)
+    history = st.session_state.chat_history + [stash_sources(turn)]
+    for evicted in history[:-CHAT_HISTORY_MAX_TURNS]:
+        sources_store().pop(evicted["turn_id"])
+    st.session_state.chat_history = history[-CHAT_HISTORY_MAX_TURNS:]
+    return history[-1]
+
+def delete_chat_history_file():
+    """Delete the chat history file from disk."""
+    CHAT_HISTORY_PATH.unlink(missing_ok=True)
 
 def clear_chat_history():
-    """Delete the chat history file from disk."""
-    if CHAT_HISTORY_PATH.exists():
-        CHAT_HISTORY_PATH.unlink()
+    """Delete the transcript once any queued appends have been written."""
+    chat_writer().submit(delete_chat_history_file)
+
+# --- HTTP session (one keep-alive connection pool for the whole server process) ---
+@st.cache_resource
+def get_session() -> requests.Session:
+    """Shared requests.Session; cache_resource keeps it alive across reruns"""
+    session = requests.Session()
+    # Idempotent calls (GET/DELETE) retry briefly on connection errors and
+    # gateway 5xx; uploads and queries (POST) are never replayed
+    retry = Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry)
+    # Same pool settings whether the backend is local or behind TLS
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+api = get_session()
+
+def rjson(response: requests.Response):
+    """Decode a JSON response body with orjson (much faster than response.json())"""
+    return orjson.loads(response.content)
+
+# --- Backend reads (cached briefly so reruns don't re-fetch them) ---
+@st.cache_data(ttl=HEALTH_TTL_SECONDS, show_spinner=False)
+def fetch_health() -> dict:
+    """GET /health (cached briefly)"""
+    return rjson(api.get(f"{API_URL}/health", timeout=QUICK_TIMEOUT))
+
+@st.cache_resource
+def documents_validator() -> dict:
+    """Last /documents ETag and the list it validated (for conditional GETs)"""
+    return {}
+
+@st.cache_data(ttl=DOCUMENTS_TTL_SECONDS, show_spinner=False)
+def fetch_documents() -> list:
+    """GET /documents (cached; cleared after uploads and deletes)"""
+    last = documents_validator()
+    headers = {"If-None-Match": last["etag"]} if "etag" in last else {}
+    response = api.get(f"{API_URL}/documents", headers=headers, timeout=QUICK_TIMEOUT)
+    if response.status_code == 304:
+        # Unchanged since the last fetch; the backend sent no body
+        return last["documents"]
+    documents = rjson(response).get("documents", [])
+    if etag := response.headers.get("ETag"):
+        last.update(etag=etag, documents=documents)
+    return documents
+
+@st.cache_data(ttl=600, show_spinner=False)
+def fetch_source_preview(filename: str, chunk: int) -> str:
+    """
+    GET /sources/{filename}/{chunk} (chunk text is immutable, so cache it longer)
+    Failures raise, so they are never cached
+    """
+    response = api.get(f"{API_URL}/sources/{quote(filename)}/{chunk}", timeout=QUICK_TIMEOUT)
+    response.raise_for_status()
+    return rjson(response)["content"]
+
+def source_preview(source: dict) -> str:
+    """Chunk text for one source, or a notice if it can't be fetched right now"""
+    # Older saved chats still carry the preview inline
+    if source.get('content'):
+        return source['content']
+    filename = source.get('filename', source.get('source', 'Unknown'))
+    try:
+        return fetch_source_preview(filename, source.get('chunk', 0))
+    except requests.exceptions.RequestException:
+        return "Preview unavailable (document may have been deleted)"
+
+def upload_in_chunks(uploaded_file) -> requests.Response:
+    """Send a large file in UPLOAD_CHUNK_BYTES pieces, then commit (and index) it"""
+    file_id = uuid4().hex
+    total = uploaded_file.size
+    sent = 0
+    progress = st.progress(0.0, text="Uploading...")
+    uploaded_file.seek(0)
+    while sent < total:
+        piece = uploaded_file.read(UPLOAD_CHUNK_BYTES)
+        for attempt in range(3):
+            try:
+                response = api.post(
+                    f"{API_URL}/upload_chunk",
+                    params={"file_id": file_id, "offset": sent, "total": total},
+                    data=piece,
+                    timeout=(CONNECT_TIMEOUT, 60)
+                )
+                response.raise_for_status()
+                break
+            except requests.exceptions.RequestException:
+                # Each piece is written at its offset, so resending it is safe
+                if attempt == 2:
+                    raise
+        sent += len(piece)
+        progress.progress(sent / total, text=f"Uploading... {sent / total:.0%}")
+    progress.progress(1.0, text="Indexing...")
+    return api.post(
+        f"{API_URL}/upload_commit",
+        params={"file_id": file_id, "name": uploaded_file.name, "total": total},
+        timeout=(CONNECT_TIMEOUT, 300)
+    )
+
+def delete_documents(filenames: list) -> list:
+    """Delete several documents in one request (one index rebuild); returns the ones that failed"""
+    try:
+        response = api.post(
+            f"{API_URL}/documents/delete",
+            json={"filenames": filenames},
+            timeout=(CONNECT_TIMEOUT, 150)
+        )
+        if response.status_code != 200:
+            return filenames
+        return response.json()["missing"]
+    except requests.exceptions.RequestException:
+        return filenames
+
+def iter_sse(response: requests.Response):
+    """Yield (event, data) pairs from a Server-Sent Events response"""
+    event = "message"
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            yield event, orjson.loads(line[len("data:"):])
+            event = "message"
+
+def prefetch_backend_state():
+    """
+    Fill the health and documents caches concurrently, so a rerun with both
+    expired waits for the slower request rather than the sum of both
+    """
+    ctx = get_script_run_ctx()
+
+    def warm(fetch):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        try:
+            fetch()
+        except Exception:
+            pass  # Not cached; the caller re-raises and reports it where it renders
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        list(executor.map(warm, (fetch_health, fetch_documents)))
+
+def stream_answer(question: str, placeholder) -> dict:
+    """
+    Ask /query_stream, rendering tokens into `placeholder` as they arrive
+    Returns the answer + sources (with "error": True if the backend failed, or
+    "truncated": True if the stream ended before its done event), or None if
+    the request itself failed
+    """
+    with api.post(
+        f"{API_URL}/query_stream",
+        json={"question": question},
+        stream=True,
+        timeout=(CONNECT_TIMEOUT, 60)
+    ) as response:
+        if response.status_code != 200:
+            st.error(f"Query failed with status {response.status_code}")
+            return None
+
+        result = {"sources": [], "filtered_by": None, "chunks_retrieved": 0}
+        answer = ""
+        complete = False
+        for event, data in iter_sse(response):
+            if event == "sources":
+                result.update(data)
+            elif event == "token":
+                answer += data["text"]
+                placeholder.markdown(answer + "▌")
+            elif event == "error":
+                answer = data.get("answer", "Error processing query")
+                result["error"] = True
+            elif event == "done":
+                complete = True
+        if not complete and not result.get("error"):
+            result["truncated"] = True
+        placeholder.markdown(answer or "No answer received")
+        result["answer"] = answer or "No answer received"
+        return result
+
+# --- Answer memo: identical questions over the same documents skip the backend ---
+@st.cache_resource
+def get_answer_cache() -> tuple:
+    """
+    Process-wide LRU of (question, document set) -> (time, answer + sources),
+    plus the lock every session's script thread takes to use it
+    """
+    return OrderedDict(), threading.Lock()
+
+def answer_cache_key(question: str, documents: list) -> tuple:
+    """Normalized question plus the current document set (any upload/delete changes it)"""
+    docs_key = tuple(sorted((doc["filename"], doc["uploaded"], doc["size"]) for doc in documents))
+    return " ".join(question.lower().split()), docs_key
+
+def cached_answer(key: tuple):
+    """Cached answer for `key` if still fresh, else None"""
+    cache, lock = get_answer_cache()
+    with lock:
+        entry = cache.get(key)
+        if entry is None or time.time() - entry[0] > ANSWER_CACHE_TTL_SECONDS:
+            return None
+        cache.move_to_end(key)
+        return dict(entry[1])
+
+def remember_answer(key: tuple, result: dict):
+    cache, lock = get_answer_cache()
+    with lock:
+        cache[key] = (time.time(), dict(result))
+        cache.move_to_end(key)
+        while len(cache) > ANSWER_CACHE_MAX_ENTRIES:
+            cache.popitem(last=False)
+
+@st.cache_resource(max_entries=16)
+def filename_regex(filenames: tuple):
+    """One compiled alternation over the known filenames (longest first), per document set"""
+    alternation = "|".join(re.escape(name) for name in sorted(filenames, key=len, reverse=True))
+    return re.compile(rf"\b({alternation})\b", re.IGNORECASE)
+
+def mentioned_filename(question: str, documents: list):
+    """Uploaded file the question names, if any (a preview of the backend's filter)"""
+    if not documents:
+        return None
+    match = filename_regex(tuple(doc["filename"] for doc in documents)).search(question)
+    return match.group(1) if match else None
+
+def current_document_list() -> list:
+    """The (cached) document list, or [] if the backend can't be reached"""
+    try:
+        return fetch_documents()
+    except Exception:
+        return []
+
+def refresh_backend_state():
+    """Drop cached backend reads after the document set changes"""
+    fetch_documents.clear()
+    fetch_health.clear()
 
 # Page config
 st.set_page_config(
@@ -38,71 +431,74 @@ st.set_page_config(
     layout="wide"
 )
 
-# Custom CSS - Dark mode compatible
-st.markdown("""
-<style>
-    .stAlert {
-        margin-top: 1rem;
-    }
-    .source-box {
-        background-color: rgba(128, 128, 128, 0.1);
-        padding: 1rem;
-        border-radius: 0.5rem;
-        margin: 0.5rem 0;
-        border: 1px solid rgba(128, 128, 128, 0.2);
-    }
-    .chat-message {
-        padding: 1.5rem;
-        border-radius: 0.5rem;
-        margin-bottom: 1rem;
-        border-left: 4px solid #1f77b4;
-        color: inherit;
-    }
-    .user-message {
-        background-color: rgba(31, 119, 180, 0.1);
-        border-left-color: #1976d2;
-    }
-    .assistant-message {
-        background-color: rgba(67, 160, 71, 0.1);
-        border-left-color: #43a047;
-    }
-    .chat-message strong {
-        color: inherit;
-    }
-    .filter-badge {
-        display: inline-block;
-        background-color: rgba(255, 152, 0, 0.2);
-        border: 1px solid rgba(255, 152, 0, 0.5);
-        padding: 0.25rem 0.75rem;
-        border-radius: 1rem;
-        font-size: 0.85rem;
-        margin-top: 0.5rem;
-        margin-left: 0.5rem;
-    }
-    .timestamp {
-        font-size: 0.72rem;
-        opacity: 0.45;
-        margin-top: 0.3rem;
-    }
-</style>
-""", unsafe_allow_html=True)
-
-# Initialize session state — load persisted chat on first run only
+# Custom CSS (static file, read once per process rather than on every rerun)
+@st.cache_resource
+def custom_css() -> str:
+    return f"<style>{Path(__file__).with_name('styles.css').read_text(encoding='utf-8')}</style>"
+
+st.markdown(custom_css(), unsafe_allow_html=True)
+
+# Initialize session state — load persisted chat on first run only (guarded
+# rather than setdefault, which would re-read the file on every rerun)
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = load_chat_history()
-if 'deleting_file' not in st.session_state:
-    st.session_state.deleting_file = None
+st.session_state.setdefault("visible_turns", VISIBLE_TURNS)
+
+# ---------------------------------------------------------------------------
+# Document list — a fragment, so it refreshes itself once its cache expires and deletes
+# rerun only this panel instead of the whole page (and chat)
+# ---------------------------------------------------------------------------
+@st.fragment(run_every=DOCUMENTS_TTL_SECONDS)
+def documents_panel():
+    st.subheader("Current Documents")
+
+    # Display documents list
+    try:
+        documents = fetch_documents()
+
+        if documents:
+            # One table element (row selection) instead of widgets per document
+            event = st.dataframe(
+                documents,
+                column_config={"filename": "📄 Document", "size": "Size", "uploaded": "Uploaded"},
+                hide_index=True,
+                use_container_width=True,
+                on_select="rerun",
+                selection_mode="multi-row",
+            )
+            selected = [documents[row]["filename"] for row in event.selection.rows if row < len(documents)]
+
+            if selected and st.button(f"🗑️ Delete Selected ({len(selected)})", use_container_width=True):
+                with st.spinner(f"Deleting {len(selected)} documents..."):
+                    failed = delete_documents(selected)
+                refresh_backend_state()
+                if len(failed) < len(selected):
+                    # The document set changed: rerun the whole app so the health
+                    # count, Clear All button and empty state pick it up too
+                    if failed:
+                        st.session_state.sidebar_notice = ("error", f"Failed to delete: {', '.join(failed)}")
+                    st.rerun()
+                st.error(f"Failed to delete: {', '.join(failed)}")
+        else:
+            st.info("No documents uploaded yet")
+    except Exception as e:
+        st.error(f"Cannot load documents: {str(e)}")
 
 # ---------------------------------------------------------------------------
 # Sidebar
 # ---------------------------------------------------------------------------
+prefetch_backend_state()
+
+# One document list per script run: the sidebar, empty state, footer and
+# answer cache all read it, so they can't disagree within a render
+current_documents = current_document_list()
+
 with st.sidebar:
     st.title("📚 Document Manager")
 
     # Health check
     try:
-        health_response = requests.get(f"{API_URL}/health", timeout=5)
-        health = health_response.json()
+        health = fetch_health()
 
         if health.get("status") == "healthy":
             st.success("✅ System Ready")
@@ -139,93 +535,76 @@ with st.sidebar:
 
             with st.spinner(f"Processing document... (may take up to {estimated_time}s for large files)"):
                 try:
-                    files = {"file": (uploaded_file.name, uploaded_file, uploaded_file.type)}
-                    response = requests.post(
-                        f"{API_URL}/upload",
-                        files=files,
-                        timeout=300
-                    )
+                    if uploaded_file.size > CHUNKED_UPLOAD_THRESHOLD:
+                        response = upload_in_chunks(uploaded_file)
+                    else:
+                        # Stream the multipart body from the file object instead of
+                        # letting requests build the whole body in memory first
+                        uploaded_file.seek(0)
+                        encoder = MultipartEncoder(
+                            fields={"file": (uploaded_file.name, uploaded_file, uploaded_file.type)}
+                        )
+                        response = api.post(
+                            f"{API_URL}/upload",
+                            data=encoder,
+                            headers={"Content-Type": encoder.content_type},
+                            timeout=(CONNECT_TIMEOUT, 300)
+                        )
 
                     if response.status_code == 200:
-                        result = response.json()
-                        st.success(f"✅ Indexed {result['chunks']} chunks")
-                        st.balloons()
+                        result = rjson(response)
+                        refresh_backend_state()
+                        # One rerun so everything already drawn from the old document
+                        # set (health count, Clear All, empty state) is redrawn
+                        st.session_state.sidebar_notice = (
+                            "success", f"✅ Uploaded — {result['chunks']} chunks queued for indexing"
+                        )
                         st.rerun()
                     else:
-                        st.error(f"Error: {response.json().get('detail', 'Upload failed')}")
+                        st.error(f"Error: {rjson(response).get('detail', 'Upload failed')}")
                 except requests.exceptions.Timeout:
                     st.warning("⏱️ Upload is taking longer than expected. Check backend logs - the file might still be processing.")
                     st.info("💡 Tip: Refresh the page in 1 minute to see if the document appears in the list.")
                 except Exception as e:
                     st.error(f"Connection error: {str(e)}")
 
-    st.divider()
-
-    # Documents list
-    st.subheader("Current Documents")
-
-    # Handle deletion if triggered
-    if st.session_state.deleting_file:
-        with st.spinner(f"Deleting {st.session_state.deleting_file}..."):
-            try:
-                delete_response = requests.delete(
-                    f"{API_URL}/documents/{st.session_state.deleting_file}",
-                    timeout=300
-                )
-
-                st.session_state.deleting_file = None
-
-                if delete_response.status_code == 200:
-                    st.rerun()
-                else:
-                    st.error(f"Failed to delete: {delete_response.text}")
+    # Outcome of an upload/delete that triggered the last rerun
+    if notice := st.session_state.pop("sidebar_notice", None):
+        kind, message = notice
+        if kind == "success":
+            st.success(message)
+            st.balloons()
+        else:
+            st.error(message)
 
-            except requests.exceptions.Timeout:
-                st.session_state.deleting_file = None
-                st.error("Delete request timed out. File may still be deleted - refresh the page.")
-            except Exception as e:
-                st.session_state.deleting_file = None
-                st.error(f"Delete error: {str(e)}")
+    st.divider()
 
-    # Display documents list
-    try:
-        docs_response = requests.get(f"{API_URL}/documents", timeout=5)
-        documents = docs_response.json()["documents"]
-
-        if documents:
-            for doc in documents:
-                col1, col2 = st.columns([3, 1])
-                with col1:
-                    st.text(f"📄 {doc['filename']}")
-                    st.caption(f"{doc['size']} • {doc['uploaded']}")
-                with col2:
-                    if st.button("🗑️", key=f"delete_{doc['filename']}", help="Delete"):
-                        st.session_state.deleting_file = doc['filename']
-                        st.rerun()
-        else:
-            st.info("No documents uploaded yet")
-    except Exception as e:
-        st.error(f"Cannot load documents: {str(e)}")
+    documents_panel()
 
     st.divider()
 
-    # Clear all documents (does NOT touch chat)
-    if st.button("🗑️ Clear All Documents", use_container_width=True, type="secondary"):
-        with st.spinner("Clearing all documents..."):
-            try:
-                response = requests.delete(f"{API_URL}/documents", timeout=300)
-                if response.status_code == 200:
-                    st.rerun()
-                else:
-                    st.error("Failed to clear documents")
-            except Exception as e:
-                st.error(f"Clear failed: {str(e)}")
+    # Clear all documents (does NOT touch chat) — only shown when there are
+    # documents, so a no-op clear never waits on the backend
+    if current_documents:
+        if st.button("🗑️ Clear All Documents", use_container_width=True, type="secondary"):
+            with st.spinner("Clearing all documents..."):
+                try:
+                    response = api.delete(f"{API_URL}/documents", timeout=(CONNECT_TIMEOUT, 300))
+                    if response.status_code == 200:
+                        refresh_backend_state()
+                        st.rerun()
+                    else:
+                        st.error("Failed to clear documents")
+                except Exception as e:
+                    st.error(f"Clear failed: {str(e)}")
 
     # Clear chat — only shown when there is actually something to clear,
     # and styled as primary so it's visually distinct from "Clear All Documents"
     if st.session_state.chat_history:
         if st.button("🧹 Clear Chat", use_container_width=True, type="primary"):
             with st.spinner("Clearing chat history..."):
+                for turn in st.session_state.chat_history:
+                    sources_store().pop(turn["turn_id"])
                 st.session_state.chat_history = []
                 clear_chat_history()
                 st.rerun()
@@ -257,107 +636,125 @@ with st.sidebar:
 st.title("🤖 RAG Document Q&A System")
 st.markdown("Ask questions about your uploaded documents • Powered by Groq")
 
-# Chat history display
-if st.session_state.chat_history:
-    for i, chat in enumerate(st.session_state.chat_history):
-        # User message (with timestamp)
-        with st.container():
-            st.markdown(f"""
-            <div class="chat-message user-message">
-                <strong>👤 You:</strong><br>
-                {chat.get('question', 'No question')}
-                <div class="timestamp">🕐 {chat.get('timestamp', '')}</div>
-            </div>
-            """, unsafe_allow_html=True)
-
-        # Assistant message
-        with st.container():
-            answer = chat.get('answer', 'No answer received')
-            filtered_by = chat.get('filtered_by')
-            chunks_retrieved = chat.get('chunks_retrieved', 0)
-            
-            filter_badge = f'\n<div class="filter-badge">🎯 Filtered by: {filtered_by}</div>' if filtered_by else ''
-
-            st.markdown(f"""
-            <div class="chat-message assistant-message">
-                <strong>🤖 Assistant:</strong> <small>({chunks_retrieved} chunks)</small><br>
-                {answer}{filter_badge}
-            </div>
-            """, unsafe_allow_html=True)
-
-        # Sources
-        sources = chat.get('sources', [])
-        if sources and len(sources) > 0:
-            with st.expander(f"🔎 View Sources ({len(sources)} chunks)", expanded=False):
-                for j, source in enumerate(sources, 1):
-                    filename = source.get('filename', source.get('source', 'Unknown'))
-                    file_type = source.get('file_type', 'unknown')
-                    st.markdown(f"""
-                    <div class="source-box">
-                        <strong>Source {j}:</strong> {filename} ({file_type.upper()}) - Chunk {source.get('chunk', 0)}<br>
-                        <small>{source.get('content', 'No content')}</small>
-                    </div>
-                    """, unsafe_allow_html=True)
+_doc_count = len(current_documents)
+
+@st.cache_data(max_entries=512, show_spinner=False)
+def source_boxes_html(sources: list, previews: Optional[list]) -> str:
+    """
+    One HTML block for all of a turn's sources (cached on the sources and
+    previews themselves, so unchanged turns aren't re-assembled on every rerun)
+    """
+    boxes = []
+    for j, source in enumerate(sources, 1):
+        filename = html.escape(str(source.get('filename', source.get('source', 'Unknown'))))
+        file_type = html.escape(str(source.get('file_type', 'unknown')).upper())
+        chunk = html.escape(str(source.get('chunk', 0)))
+        content = html.escape(previews[j - 1]) if previews else ""
+        boxes.append(
+            f'<div class="source-box"><strong>Source {j}:</strong> {filename} '
+            f'({file_type}) - Chunk {chunk}<br><small>{content}</small></div>'
+        )
+    return "".join(boxes)
+
+def render_turn_details(chat: dict):
+    """Retrieval caption and sources for an answered turn (inside its assistant message)"""
+    if chat.get('truncated'):
+        st.warning("⚠️ The answer stream was cut off - this answer may be incomplete.")
+    filtered_by = chat.get('filtered_by')
+    caption = f"{chat.get('chunks_retrieved', 0)} chunks"
+    if filtered_by:
+        caption += f" • 🎯 Filtered by: {filtered_by}"
+    st.caption(caption)
+
+    # Sources
+    sources = sources_store().get(chat['turn_id'])
+    if sources:
+        with st.expander(f"🔎 View Sources ({len(sources)} chunks)", expanded=False):
+            # Chunk text is only fetched once the user asks for it
+            show_text = st.toggle("Show chunk text", key=f"show_sources_{chat['turn_id']}")
+            previews = [source_preview(source) for source in sources] if show_text else None
+            st.markdown(source_boxes_html(sources, previews), unsafe_allow_html=True)
+
+def show_older_turns():
+    """Reveal VISIBLE_TURNS more turns above the current window"""
+    st.session_state.visible_turns += VISIBLE_TURNS
+
+# Chat history display — a fragment, so expanding sources or a sidebar refresh
+# doesn't re-render every past turn
+@st.fragment
+def chat_history_panel():
+    history = st.session_state.chat_history
+    hidden = len(history) - st.session_state.visible_turns
+    if hidden > 0:
+        st.button(
+            f"⬆️ Load {min(hidden, VISIBLE_TURNS)} earlier questions",
+            on_click=show_older_turns,
+            use_container_width=True
+        )
+    for chat in history[-st.session_state.visible_turns:]:
+        with st.chat_message("user"):
+            st.markdown(chat.get('question', 'No question'))
+            st.caption(f"🕐 {chat.get('timestamp', '')}")
+
+        with st.chat_message("assistant"):
+            st.markdown(chat.get('answer', 'No answer received'))
+            render_turn_details(chat)
 
+# Placeholder so the empty state can be removed as soon as a question is asked
+empty_state = st.empty()
+if st.session_state.chat_history:
+    chat_history_panel()
 else:
     # Context-aware empty state: different message depending on whether
     # documents are already loaded or not
-    try:
-        _doc_count = len(requests.get(f"{API_URL}/documents", timeout=3).json()["documents"])
-    except Exception:
-        _doc_count = 0
-
-    if _doc_count == 0:
-        st.info("👋 Welcome! Upload a document in the sidebar, then start asking questions.")
-        st.markdown("""
-        **💡 Pro Tips:**
-        - Upload multiple documents
-        - Ask: *"What is in doc.txt?"* to search only that file
-        - Ask: *"Compare the two documents"* to search across all files
-        - Provide clear context in your questions for better responses
-        """)
-    else:
-        st.info(f"👋 You have {_doc_count} document(s) loaded — ask your first question below!")
-
-# Query input
-st.markdown("---")
-with st.form(key="query_form", clear_on_submit=True):
-    col1, col2 = st.columns([5, 1])
-    with col1:
-        question = st.text_input(
-            "Ask a question:",
-            placeholder="What is the main topic? (or: Summarize doc.txt?)",
-            label_visibility="collapsed",
-            key="question_input"
-        )
-    with col2:
-        submit = st.form_submit_button("Ask 🚀", use_container_width=True)
-
-if submit and question:
-    with st.spinner("🤔 Thinking... (querying Groq)"):
+    with empty_state.container():
+        if _doc_count == 0:
+            st.info("👋 Welcome! Upload a document in the sidebar, then start asking questions.")
+            st.markdown("""
+            **💡 Pro Tips:**
+            - Upload multiple documents
+            - Ask: *"What is in doc.txt?"* to search only that file
+            - Ask: *"Compare the two documents"* to search across all files
+            - Provide clear context in your questions for better responses
+            """)
+        else:
+            st.info(f"👋 You have {_doc_count} document(s) loaded — ask your first question below!")
+
+# Query input — the answer streams in token by token from /query_stream.
+# The new turn is rendered in place below the history (no follow-up rerun);
+# the next rerun draws it inside the history panel
+if question := st.chat_input("Ask a question: What is the main topic? (or: Summarize doc.txt?)"):
+    empty_state.empty()
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    with st.chat_message("user"):
+        st.markdown(question)
+        st.caption(f"🕐 {timestamp}")
+
+    with st.chat_message("assistant"):
+        placeholder = st.empty()
         try:
-            response = requests.post(
-                f"{API_URL}/query",
-                json={"question": question},
-                timeout=60
-            )
-
-            if response.status_code == 200:
-                result = response.json()
+            cache_key = answer_cache_key(question, current_documents)
+            result = cached_answer(cache_key)
+            if result is not None:
+                placeholder.markdown(result["answer"])
+            else:
+                # Show the file filter right away; the backend confirms it with the answer
+                filtered_by = mentioned_filename(question, current_documents)
+                if filtered_by:
+                    placeholder.markdown(f"🤔 Thinking... (searching 🎯 {filtered_by})")
+                else:
+                    placeholder.markdown("🤔 Thinking... (querying Groq)")
+                result = stream_answer(question, placeholder)
+                if result is not None and not result.pop("error", False) and not result.get("truncated"):
+                    remember_answer(cache_key, result)
 
-                st.session_state.chat_history.append({
+            if result is not None:
+                turn = append_chat_turn({
                     "question": question,
-                    "answer": result.get("answer", "No answer received"),
-                    "sources": result.get("sources", []),
-                    "filtered_by": result.get("filtered_by"),
-                    "chunks_retrieved": result.get("chunks_retrieved", 0),
-                    "timestamp": datetime.now().strftime("%H:%M:%S")
+                    **result,
+                    "timestamp": timestamp
                 })
-                save_chat_history(st.session_state.chat_history)
-
-                st.rerun()
-            else:
-                st.error(f"Query failed with status {response.status_code}")
+                render_turn_details(turn)
 
         except requests.exceptions.Timeout:
             st.error("⏱️ Request timed out. Please try again.")
@@ -372,13 +769,7 @@ if submit and question:
 st.divider()
 col1, col2 = st.columns(2)
 with col1:
-    # Reuse _doc_count if it was set above; otherwise fetch it now
-    try:
-        _footer_docs = len(requests.get(f"{API_URL}/documents", timeout=2).json()["documents"])
-    except Exception:
-        _footer_docs = 0
-
-    if _footer_docs > 0:
+    if _doc_count > 0:
         st.caption("💡 Tip: Mention a filename to filter search (e.g., 'What is in doc.pdf?')")
     else:
         st.caption("💡 Tip: Upload a document in the sidebar to get started.")
@@ -0,0 +1,71 @@
+import hashlib
+import os
+import sys
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pytest
+
+# Backend modules import each other by bare name (import config, ...)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic unit vectors seeded by the text (no model download)"""
+
+    fingerprint = "fake"
+    dimension = 96
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for i, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=4).digest(), "little")
+            vectors[i] = np.random.default_rng(seed).standard_normal(self.dimension)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+
+def make_chunks(filename: str, count: int) -> List[Document]:
+    return [
+        Document(
+            page_content=f"{filename} chunk {i}",
+            metadata={"filename": filename, "chunk": i, "uploaded_at": "2026-01-01T00:00:00"},
+        )
+        for i in range(count)
+    ]
+
+
+@pytest.fixture(params=["hnsw", "ivfpq"])
+def engine(request, tmp_path, monkeypatch):
+    """RAGEngine on fake embeddings, storing under tmp_path, with a small-corpus HNSW or IVFPQ index"""
+    import config
+    import rag_engine
+
+    monkeypatch.setattr(config, "VECTORSTORE_DIR", tmp_path / "vectorstore")
+    monkeypatch.setattr(config, "EMBEDDING_CACHE_DIR", tmp_path / "emb_cache")
+    monkeypatch.setattr(config, "FAISS_MMAP", False)
+    (tmp_path / "vectorstore").mkdir()
+    if request.param == "ivfpq":
+        monkeypatch.setattr(config, "FAISS_IVFPQ_THRESHOLD", 100)
+        monkeypatch.setattr(config, "FAISS_IVF_NLIST", 8)
+        monkeypatch.setattr(config, "FAISS_PQ_M", 48)
+        monkeypatch.setattr(config, "FAISS_PQ_NBITS", 4)
+    else:
+        monkeypatch.setattr(config, "FAISS_IVFPQ_THRESHOLD", 10**9)
+
+    rag = rag_engine.RAGEngine()
+    rag._embeddings = FakeEmbeddings()
+    yield rag
+    rag.wait_for_save()
+    rag.embedding_cache.close()
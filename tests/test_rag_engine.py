@@ -0,0 +1,133 @@
+import faiss
+
+from conftest import make_chunks
+
+
+def index_files(engine, files):
+    for filename, count in files.items():
+        engine.index_documents(make_chunks(filename, count))
+    engine.flush()
+
+
+def test_index_type_matches_config(engine, request):
+    index_files(engine, {"a.pdf": 150, "b.pdf": 150})
+    is_ivf = isinstance(engine._base_index(), faiss.IndexIVF)
+    assert is_ivf == (request.node.callspec.params["engine"] == "ivfpq")
+
+
+def test_filtered_query_only_returns_that_file(engine):
+    index_files(engine, {"a.pdf": 150, "b.pdf": 150})
+    docs = engine._get_filtered_documents("b.pdf chunk 7", "b.pdf")
+    assert docs
+    assert {doc.metadata["filename"] for doc in docs} == {"b.pdf"}
+
+
+def test_filtered_query_for_unknown_file_is_empty(engine):
+    index_files(engine, {"a.pdf": 150, "b.pdf": 150})
+    assert engine._get_filtered_documents("anything", "missing.pdf") == []
+
+
+def test_delete_removes_file_from_search(engine):
+    index_files(engine, {"a.pdf": 150, "b.pdf": 150, "c.pdf": 20})
+    total = engine.vectorstore.index.ntotal
+
+    assert engine.delete_document_from_vectorstore("b.pdf")
+
+    assert engine.vectorstore.index.ntotal == total - 150
+    assert "b.pdf" not in engine.known_filenames()
+    assert engine._get_filtered_documents("b.pdf chunk 7", "b.pdf") == []
+    docs = engine._get_filtered_documents("a.pdf chunk 7", "a.pdf")
+    assert docs and {doc.metadata["filename"] for doc in docs} == {"a.pdf"}
+    vector = engine.embeddings.encode(["b.pdf chunk 7"])[0]
+    assert all(doc.metadata["filename"] != "b.pdf" for doc in engine._search(engine.vectorstore, vector, 20))
+
+
+def test_delete_by_id_keeps_ivf_index(engine):
+    index_files(engine, {"a.pdf": 150, "b.pdf": 150})
+    index = engine.vectorstore.index
+
+    assert engine.delete_document_from_vectorstore("b.pdf")
+
+    # IVF drops the ids in place; HNSW is rebuilt from the remaining vectors
+    assert (engine.vectorstore.index is index) == isinstance(index, faiss.IndexIVF)
+
+
+def test_delete_persists(engine):
+    import rag_engine
+
+    index_files(engine, {"a.pdf": 150, "b.pdf": 150})
+    assert engine.delete_document_from_vectorstore("a.pdf")
+    engine.wait_for_save()
+
+    reloaded = rag_engine.RAGEngine()
+    reloaded._embeddings = engine.embeddings
+    assert reloaded.known_filenames() == {"b.pdf"}
+    assert reloaded.vectorstore.index.ntotal == 150
+    reloaded.embedding_cache.close()
+
+
+def test_delete_unindexed_file_leaves_index_alone(engine):
+    index_files(engine, {"a.pdf": 150})
+    index = engine.vectorstore.index
+
+    assert not engine.delete_document_from_vectorstore("missing.pdf")
+    assert engine.vectorstore.index is index
+
+    engine.index_documents(make_chunks("queued.pdf", 5))
+    assert engine.delete_document_from_vectorstore("queued.pdf")
+    assert engine.vectorstore.index.ntotal == 150
+
+
+def test_bulk_delete_rebuilds_once(engine, monkeypatch):
+    index_files(engine, {"a.pdf": 150, "b.pdf": 150, "c.pdf": 150})
+    rebuilds = []
+    reconstruct = engine._reconstruct_vectors
+    monkeypatch.setattr(engine, "_reconstruct_vectors", lambda ids: rebuilds.append(ids) or reconstruct(ids))
+
+    assert engine.delete_documents_from_vectorstore(["a.pdf", "c.pdf", "missing.pdf"])
+
+    assert engine.known_filenames() == {"b.pdf"}
+    assert engine.vectorstore.index.ntotal == 150
+    assert len(rebuilds) == (0 if isinstance(engine.vectorstore.index, faiss.IndexIVF) else 1)
+
+
+def test_embedding_model_is_created_once_under_concurrency(tmp_path, monkeypatch):
+    import threading
+    import time
+    import config
+    import rag_engine
+    from conftest import FakeEmbeddings
+
+    monkeypatch.setattr(config, "EMBEDDING_CACHE_DIR", tmp_path / "emb_cache")
+
+    created = []
+
+    def slow_create():
+        time.sleep(0.05)
+        created.append(FakeEmbeddings())
+        return created[-1]
+
+    monkeypatch.setattr(rag_engine, "create_embeddings", slow_create)
+    rag = rag_engine.RAGEngine()
+    threads = [threading.Thread(target=lambda: rag.embeddings) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    rag.embedding_cache.close()
+
+
+def test_dedupe_keeps_chunks_that_share_a_header():
+    from langchain_core.documents import Document
+    import rag_engine
+
+    header = "Quarterly report - " * 10
+    docs = [
+        Document(page_content=header + "revenue grew"),
+        Document(page_content=header + "costs fell"),
+        Document(page_content=header + "revenue grew"),
+    ]
+    kept = rag_engine.RAGEngine._dedupe_documents(docs)
+    assert [doc.page_content for doc in kept] == [header + "revenue grew", header + "costs fell"]